@@ -0,0 +1,205 @@
+# admission.py - Moreweb AI Runtime v0.1.0
+# Admission control: caps concurrent upstream work and queues the overflow fairly by priority tier and client.
+
+import asyncio
+import collections
+import contextlib
+import math
+import threading
+import time
+
+PRIORITIES = ("high", "normal", "low")
+DEFAULT_PRIORITY = PRIORITIES.index("normal")
+HOLD_EWMA_ALPHA = 0.2     # smoothing for the average hold time behind Retry-After
+DEFAULT_HOLD = 5.0        # seconds assumed per request before any has finished
+
+class Overloaded(Exception):
+    def __init__(self, message, retry_after, reason):
+        super().__init__(message)
+        self.retry_after, self.reason = retry_after, reason
+
+class _Waiter:
+    __slots__ = ("client", "priority", "notify", "granted")
+    def __init__(self, client, priority, notify):
+        self.client, self.priority, self.notify, self.granted = client, priority, notify, False
+
+class Gate:
+    # At most `capacity` holders at once (None = unlimited). Waiters are served strictly by priority tier and
+    # round-robin across clients within a tier, so one busy client cannot starve the others.
+    def __init__(self, name, capacity=None, max_waiting=None):
+        self.name = name
+        self._lock = threading.Lock(); self._queues = [collections.OrderedDict() for _ in PRIORITIES]
+        self.capacity, self.max_waiting = capacity, max_waiting
+        self.active = self.waiting = 0
+        self.admitted = self.rejected = self.timed_out = 0
+        self._hold = None
+
+    def configure(self, capacity, max_waiting=None):
+        with self._lock:
+            self.capacity, self.max_waiting = capacity, max_waiting
+            self._grant()
+
+    def _grant(self):
+        while self.waiting and (self.capacity is None or self.active < self.capacity):
+            queue = next(queue for queue in self._queues if queue)
+            client, waiters = next(iter(queue.items()))
+            waiter = waiters.popleft()
+            if waiters: queue.move_to_end(client)
+            else: del queue[client]
+            self.waiting -= 1; self.active += 1; self.admitted += 1
+            waiter.granted = True; waiter.notify()
+
+    def _enqueue(self, client, priority, notify):
+        waiter = _Waiter(client, priority, notify)
+        with self._lock:
+            if self.capacity is None or (self.active < self.capacity and not self.waiting):
+                self.active += 1; self.admitted += 1; waiter.granted = True
+                return waiter
+            if self.max_waiting is not None and self.waiting >= self.max_waiting:
+                self.rejected += 1
+                raise Overloaded(f"Too many requests are waiting for {self.name}.", self._retry_after(), "queue_full")
+            self._queues[priority].setdefault(client, collections.deque()).append(waiter); self.waiting += 1
+        return waiter
+
+    def _withdraw(self, waiter):
+        # Returns False when the waiter was granted a slot in the meantime; the caller then owns (and must release) it.
+        with self._lock:
+            if waiter.granted: return False
+            waiters = self._queues[waiter.priority][waiter.client]; waiters.remove(waiter)
+            if not waiters: del self._queues[waiter.priority][waiter.client]
+            self.waiting -= 1
+            return True
+
+    def _timed_out(self):
+        with self._lock: self.timed_out += 1; retry_after = self._retry_after()
+        return Overloaded(f"Timed out waiting for {self.name}.", retry_after, "queue_timeout")
+
+    def _retry_after(self):
+        # Seconds until the queue ahead of a new arrival should have drained, from the smoothed hold time.
+        hold = self._hold if self._hold is not None else DEFAULT_HOLD
+        return max(1, math.ceil((self.waiting + 1) * hold / max(self.capacity or 1, 1)))
+
+    def acquire(self, client="", priority=DEFAULT_PRIORITY, timeout=None):
+        # Blocks for up to `timeout` seconds (None = indefinitely) and returns the start time to pass to release().
+        event = threading.Event()
+        waiter = self._enqueue(client, priority, event.set)
+        if not waiter.granted and not event.wait(timeout) and self._withdraw(waiter): raise self._timed_out()
+        return time.monotonic()
+
+    async def acquire_async(self, client="", priority=DEFAULT_PRIORITY, timeout=None):
+        loop = asyncio.get_running_loop(); granted = loop.create_future()
+        waiter = self._enqueue(client, priority, lambda: loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(None)))
+        if not waiter.granted:
+            try: await asyncio.wait_for(asyncio.shield(granted), timeout)
+            except asyncio.TimeoutError:
+                if self._withdraw(waiter): raise self._timed_out()
+            except asyncio.CancelledError:
+                if not self._withdraw(waiter): self.release(None)
+                raise
+        return time.monotonic()
+
+    def release(self, started):
+        with self._lock:
+            self.active -= 1
+            if started is not None:
+                held = time.monotonic() - started
+                self._hold = held if self._hold is None else HOLD_EWMA_ALPHA * held + (1 - HOLD_EWMA_ALPHA) * self._hold
+            self._grant()
+
+    @contextlib.contextmanager
+    def hold(self, client="", priority=DEFAULT_PRIORITY, timeout=None):
+        started = self.acquire(client, priority, timeout)
+        try: yield
+        finally: self.release(started)
+
+    @contextlib.asynccontextmanager
+    async def hold_async(self, client="", priority=DEFAULT_PRIORITY, timeout=None):
+        started = await self.acquire_async(client, priority, timeout)
+        try: yield
+        finally: self.release(started)
+
+    def busy_for(self):
+        # None while a slot is free, otherwise the Retry-After estimate for a newcomer.
+        with self._lock:
+            if self.capacity is None or self.active < self.capacity: return None
+            return self._retry_after()
+
+    def stats(self):
+        with self._lock: return {"active": self.active, "waiting": self.waiting, "capacity": self.capacity, "admitted": self.admitted, "rejected": self.rejected, "timed_out": self.timed_out}
+
+class Admitted:
+    # The slots held for one request: the request slot and, in Manual mode, the model's slot.
+    def __init__(self, held):
+        self._held = held; self._lock = threading.Lock()
+
+    def release(self, measured=True):
+        # measured=False for a request that turned out to do no upstream work, so it does not skew Retry-After.
+        # Later calls do nothing, so a request abandoned while upstream is still running can release early.
+        with self._lock: held, self._held = self._held, []
+        for gate, started in held: gate.release(started if measured else None)
+
+class Admission:
+    # One gate for whole requests plus one per model with a configured concurrency cap, all driven by RuntimeConfig.
+    def __init__(self):
+        self.requests = Gate("the server")
+        self.queue_timeout = None
+        self._lock = threading.Lock(); self._model_limits = {}; self._models = {}
+
+    def configure(self, settings):
+        self.requests.configure(settings["max_active_requests"] or None, settings["max_queued_requests"])
+        self.queue_timeout = settings["queue_timeout_s"]
+        with self._lock:
+            self._model_limits = dict(settings["model_concurrency"])
+            for name, gate in self._models.items(): gate.configure(self._model_limits.get(name))
+
+    def admit(self, client, priority, manual_model=None, auto_models=()):
+        # Takes everything a request needs before its response starts, so a request that cannot get it is answered 429:
+        # a request slot, the model's slot for a Manual-mode request, and for an AUTO request at least one model in
+        # `auto_models` that is not at its cap (otherwise it would only skip them all).
+        deadline = time.monotonic() + self.queue_timeout
+        held = [(self.requests, self.requests.acquire(client, priority, self.queue_timeout))]
+        try:
+            if manual_model is not None:
+                gate = self.model(manual_model)
+                held.append((gate, gate.acquire(client, priority, max(deadline - time.monotonic(), 0))))
+            else: self._check_models(auto_models)
+        except Overloaded:
+            Admitted(held).release(measured=False); raise
+        return Admitted(held)
+
+    async def admit_async(self, client, priority, manual_model=None, auto_models=()):
+        deadline = time.monotonic() + self.queue_timeout
+        held = [(self.requests, await self.requests.acquire_async(client, priority, self.queue_timeout))]
+        try:
+            if manual_model is not None:
+                gate = self.model(manual_model)
+                held.append((gate, await gate.acquire_async(client, priority, max(deadline - time.monotonic(), 0))))
+            else: self._check_models(auto_models)
+        except (Overloaded, asyncio.CancelledError):
+            Admitted(held).release(measured=False); raise
+        return Admitted(held)
+
+    def _check_models(self, models):
+        busy = [self.model(name).busy_for() for name in models]
+        if busy and None not in busy: raise Overloaded("Every model is at its concurrency cap.", min(busy), "models_busy")
+
+    def model(self, name):
+        with self._lock:
+            gate = self._models.get(name)
+            if gate is None: gate = self._models[name] = Gate(f"model '{name}'", self._model_limits.get(name))
+        return gate
+
+    def model_slot(self, client, priority, wait):
+        # A `slot` hook for api_server.stream_completion. With wait=False a model at its cap is skipped at once,
+        # which is what the AUTO modes want since another model in the list can serve the request.
+        timeout = self.queue_timeout if wait else 0
+        return lambda model_name: self.model(model_name).hold(client, priority, timeout)
+
+    def model_stats(self):
+        with self._lock: gates = dict(self._models)
+        return {name: gate.stats() for name, gate in gates.items() if gate.capacity is not None}
+
+def parse_priority(value):
+    # Unknown or missing X-Priority values fall back to the normal tier.
+    value = (value or "").strip().lower()
+    return PRIORITIES.index(value) if value in PRIORITIES else DEFAULT_PRIORITY
@@ -0,0 +1,66 @@
+# aggregation.py - Moreweb AI Runtime v0.1.0
+# Folds g4f chunks into the answer text and its final model/usage, without keeping the chunk objects alive.
+
+import re
+import time
+
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+def usage_dict(usage):
+    return {"prompt_tokens": usage.prompt_tokens, "completion_tokens": usage.completion_tokens, "total_tokens": usage.total_tokens}
+
+def estimate_tokens(text):
+    # Words and punctuation marks are a cheap, usually slightly low, stand-in for BPE token counts.
+    return sum(1 for _ in TOKEN_PATTERN.finditer(text))
+
+def estimate_usage(messages, text):
+    prompt_tokens = sum(estimate_tokens(message["content"]) for message in messages if isinstance(message, dict) and isinstance(message.get("content"), str))
+    completion_tokens = estimate_tokens(text)
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+
+class UpstreamTimeout(Exception):
+    pass
+
+class Aggregator:
+    # `max_chars` (None or 0 = unlimited) truncates the answer; once `truncated` is set the caller should stop reading upstream.
+    # `timeout` (None or 0 = none) is the time budget for the whole upstream answer, enforced by the caller through remaining().
+    def __init__(self, max_chars=None, timeout=None):
+        self.max_chars = max_chars or None
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self._parts = []; self.chars = 0
+        self.model = self.usage = None
+        self.truncated = False
+
+    def add(self, chunk):
+        # Records one chunk and returns the content it contributed (possibly cut short), or None.
+        return self.add_delta(chunk.choices[0].delta.content if chunk.choices else None, chunk.model, usage_dict(chunk.usage) if chunk.usage else None)
+
+    def add_delta(self, content, model=None, usage=None):
+        # add() for a single_flight.Delta's fields; `usage` is already a dict.
+        if model: self.model = model
+        if usage: self.usage = usage
+        if not content or self.truncated: return None
+        if self.max_chars is not None and self.chars + len(content) > self.max_chars:
+            content = content[:self.max_chars - self.chars]; self.truncated = True
+        self._parts.append(content); self.chars += len(content)
+        return content or None
+
+    def remaining(self, wait=None):
+        # Shortens a wait (None = unbounded) so it ends no later than the deadline.
+        if self.deadline is None: return wait
+        left = max(self.deadline - time.monotonic(), 0.0)
+        return left if wait is None else min(wait, left)
+
+    def check_deadline(self):
+        if self.deadline is not None and time.monotonic() >= self.deadline: raise UpstreamTimeout("The upstream provider did not finish in time.")
+
+    def text(self):
+        if len(self._parts) > 1: self._parts = ["".join(self._parts)]
+        return self._parts[0] if self._parts else ""
+
+    @property
+    def finish_reason(self): return "length" if self.truncated else "stop"
+
+    def usage_or_estimate(self, messages):
+        # Providers often omit usage; an estimate keeps the OpenAI response shape complete.
+        return self.usage if self.usage is not None else estimate_usage(messages, self.text())
@@ -2,103 +2,408 @@
 # Core backend server that runs g4f logic and serves the API.
 
 import flask
-from flask import Flask, request, jsonify, Response
+from flask import Flask, request, jsonify, Response, g
+from werkzeug.serving import make_server
 from g4f.client import Client
+import contextlib
 import logging
-import json
+import os
+import threading
 import time
 import uuid
+from model_health import HealthBoard
+from upstream_race import race_streams, DEFAULT_RACE_WIDTH
+from response_cache import ResponseCache, cache_key
+from single_flight import SingleFlight, AsyncSingleFlight
+from admission import Admission, Overloaded, parse_priority
+from sse_encoder import event_writer, DONE
+from aggregation import Aggregator, UpstreamTimeout, estimate_usage
+from continuation import continuation_messages, trim_overlap
+from model_catalog import catalog
+import telemetry
+from telemetry import RequestTrace
 
 log = logging.getLogger('werkzeug')
 log.setLevel(logging.ERROR)
 
+SHUTDOWN_GRACE = 5   # seconds open streams get to finish on shutdown before they are cancelled
 AUTO_PLUS_MODELS = ["gpt-4o", "gpt-4-turbo", "gpt-4", "claude-3-opus", "gemini-pro", "deepseek-v3", "Llama3-70b-chat"]
 AUTO_MODELS = ["gpt-3.5-turbo", "gpt-4", "Llama3-8b-chat", "gemini", "mistral-7b"]
 
-app_gui = None
+config = None
+health_board = HealthBoard()
+response_cache = ResponseCache()
+in_flight = SingleFlight()
+in_flight_async = AsyncSingleFlight()   # the ASGI engine's flights, which live on its event loop
+admission = Admission()
+_server = None
+health_board.add_listener(telemetry.record_attempt)
 
-def create_app(gui_instance):
-    global app_gui
-    app_gui = gui_instance
+def create_app(runtime_config):
+    # runtime_config is a runtime_config.RuntimeConfig; the GUI and headless.py each own one.
+    global config
+    config = runtime_config
+    admission.configure(config.snapshot())
+    config.add_change_listener(admission.configure)
     flask_app = Flask(__name__)
 
+    @flask_app.before_request
+    def assign_trace_id():
+        g.trace_id = telemetry.new_trace_id(request.headers.get("X-Request-ID"))
+
+    @flask_app.after_request
+    def echo_trace_id(response):
+        response.headers["X-Request-ID"] = g.trace_id
+        return response
+
     @flask_app.route('/')
     def index():
         return "<h1>Moreweb AI Runtime</h1><p>API endpoint is at /v1/chat/completions</p>"
     
     @flask_app.route('/shutdown', methods=['POST'])
     def shutdown():
-        func = request.environ.get('werkzeug.server.shutdown')
-        if func is None: raise RuntimeError('Not running with the Werkzeug Server')
-        func()
+        if not config.authorize(request.remote_addr, request.headers.get("Authorization")): return jsonify({"error": "Not authorized."}), 403
+        if _server is None: return jsonify({"error": "The server was not started with run_server."}), 500
+        stop_server()
         return 'Server shutting down...'
 
+    @flask_app.route('/admin/config', methods=['GET', 'PATCH'])
+    def admin_config():
+        if not config.authorize(request.remote_addr, request.headers.get("Authorization")): return jsonify({"error": "Not authorized."}), 403
+        if request.method == 'PATCH':
+            changes = request.get_json(silent=True)
+            if not isinstance(changes, dict): return jsonify({"error": "The request body must be a JSON object."}), 400
+            try: config.update(**changes)
+            except ValueError as e: return jsonify({"error": str(e)}), 400
+            config.log(f"Configuration updated through the admin endpoint: {', '.join(sorted(changes))}.")
+        return jsonify(config.public_snapshot())
+
+    @flask_app.route('/v1/models', methods=['GET'])
+    def list_models():
+        models = catalog.models()
+        if catalog.etag in request.if_none_match: return Response(status=304, headers={"ETag": f'"{catalog.etag}"'})
+        response = jsonify({"object": "list", "data": models})
+        response.set_etag(catalog.etag)
+        return response
+
+    @flask_app.route('/v1/models/<path:model_id>', methods=['GET'])
+    def retrieve_model(model_id):
+        model = catalog.model(model_id)
+        if model is None: return jsonify({"error": f"The model '{model_id}' does not exist."}), 404
+        return jsonify(model)
+
+    @flask_app.route('/v1/batches', methods=['GET', 'POST'])
+    def batches():
+        # Batches read and write files on the server, so they are an admin capability like /admin/config.
+        import batch_runner
+        if not config.authorize(request.remote_addr, request.headers.get("Authorization")): return jsonify({"error": "Not authorized."}), 403
+        if request.method == 'GET': return jsonify({"object": "list", "data": [job.as_dict() for job in batch_runner.jobs.values()]})
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or not data.get("input_file") or not data.get("output_file"):
+            return jsonify({"error": "The 'input_file' and 'output_file' fields are required."}), 400
+        if not os.path.isfile(data["input_file"]): return jsonify({"error": f"Input file '{data['input_file']}' does not exist."}), 400
+        mode = data.get("mode", config.snapshot()["mode"])
+        if mode not in ("Auto", "AUTO+"): return jsonify({"error": "The 'mode' field must be 'Auto' or 'AUTO+'."}), 400
+        try:
+            job = batch_runner.BatchJob(data["input_file"], data["output_file"], mode, int(data.get("workers", batch_runner.DEFAULT_WORKERS)),
+                                        {str(name): int(limit) for name, limit in (data.get("model_concurrency") or {}).items()},
+                                        int(data.get("default_model_concurrency", batch_runner.DEFAULT_MODEL_CONCURRENCY)), int(data.get("max_retries", batch_runner.DEFAULT_MAX_RETRIES)), config.log)
+        except (TypeError, ValueError, AttributeError) as e:
+            return jsonify({"error": f"Invalid batch options: {e}"}), 400
+        return jsonify(job.start().as_dict())
+
+    @flask_app.route('/v1/batches/<batch_id>', methods=['GET'])
+    def retrieve_batch(batch_id):
+        import batch_runner
+        if not config.authorize(request.remote_addr, request.headers.get("Authorization")): return jsonify({"error": "Not authorized."}), 403
+        job = batch_runner.jobs.get(batch_id)
+        if job is None: return jsonify({"error": f"No batch with id '{batch_id}'."}), 404
+        return jsonify(job.as_dict())
+
+    @flask_app.route('/v1/batches/<batch_id>/cancel', methods=['POST'])
+    def cancel_batch(batch_id):
+        import batch_runner
+        if not config.authorize(request.remote_addr, request.headers.get("Authorization")): return jsonify({"error": "Not authorized."}), 403
+        job = batch_runner.jobs.get(batch_id)
+        if job is None: return jsonify({"error": f"No batch with id '{batch_id}'."}), 404
+        job.cancel()
+        return jsonify(job.as_dict())
+
+    @flask_app.route('/metrics', methods=['GET'])
+    def metrics():
+        return Response(telemetry.render(), mimetype='text/plain; version=0.0.4')
+
+    @flask_app.route('/v1/cache', methods=['GET', 'DELETE'])
+    def cache_stats():
+        if request.method == 'DELETE':
+            if not config.authorize(request.remote_addr, request.headers.get("Authorization")): return jsonify({"error": "Not authorized."}), 403
+            response_cache.clear()
+        return jsonify(response_cache.stats())
+
     @flask_app.route('/v1/chat/completions', methods=['POST'])
     def chat_completions():
+        trace = None
         try:
             data = request.get_json()
             messages = data.get("messages")
             stream = data.get("stream", False)
-            mode = app_gui.get_current_mode()
+            settings = config.snapshot()
+            mode = settings["mode"]
+            model, provider = (settings["model"], settings["provider"]) if mode == "Manual" else (None, None)
+            trace = RequestTrace(mode, stream, g.trace_id, provider)
+
+            if not messages:
+                trace.finish("rejected", error_type="bad_request")
+                return jsonify({"error": "The 'messages' field is required."}), 400
+            race_width, hedge_delay_ms, error = parse_race_options(data)
+            if error:
+                trace.finish("rejected", error_type="bad_request")
+                return jsonify({"error": error}), 400
+
+            key = cache_key(messages, mode, model, provider)
+            no_store = request.cache_control.no_store
+            cached = None if request.cache_control.no_cache else response_cache.get(key)
+            if cached is not None:
+                config.log(f"Cache hit in '{mode}' mode.")
+                trace.finish("cached", cached["model"])
+                return cached_response(cached, stream, settings)
+
+            # Requests that can join an identical in-flight generation add no upstream load, so they skip the queue.
+            client_id, priority = request.headers.get("X-Client-ID") or request.remote_addr, parse_priority(request.headers.get("X-Priority"))
+            admitted = None
+            if not in_flight.has(key):
+                try: admitted = admission.admit(client_id, priority, model, () if mode == "Manual" else auto_models(mode))
+                except Overloaded as e: return rejected(e, trace)
 
-            if not messages: return jsonify({"error": "The 'messages' field is required."}), 400
+            # Only answers produced start-to-finish by a single model are worth caching.
+            outcome = {"complete": False, "spliced": False}
 
-            client = Client()
-            
             def get_g4f_response_stream():
-                if mode == "Manual":
-                    model, provider = app_gui.get_manual_model(), app_gui.get_manual_provider()
-                    app_gui.log(f"Manual mode request: {provider}/{model}")
-                    try:
-                        yield from client.chat.completions.create(model=model, provider=provider, messages=messages, stream=True)
-                    except Exception as e:
-                        app_gui.log(f"Manual request with {provider}/{model} failed: {e}")
-                else:
-                    model_list = AUTO_PLUS_MODELS if mode == "AUTO+" else AUTO_MODELS
-                    app_gui.log(f"Auto mode request with list: {model_list}")
-                    for model_name in model_list:
-                        try:
-                            app_gui.log(f"Attempting model: {model_name}")
-                            yield from client.chat.completions.create(model=model_name, messages=messages, stream=True)
-                            app_gui.log(f"Success with model: {model_name}!")
-                            return
-                        except Exception as e:
-                            app_gui.log(f"Model {model_name} failed: {str(e)[:150]}...")
-                            continue
+                # A Manual-mode request already holds its model's slot; AUTO requests skip models at their cap.
+                return stream_completion(messages, mode, model, provider, race_width, hedge_delay_ms / 1000, outcome, config.log, None if mode == "Manual" else admission.model_slot(client_id, priority, wait=False))
+
+            def produce():
+                # Runs once per flight on its own thread; identical concurrent requests share what it yields.
+                try: yield from get_g4f_response_stream()
+                finally:
+                    if admitted is not None: admitted.release()
+
+            def store(flight):
+                # The flight already holds the whole answer, so the cache entry is built from it rather than a third copy.
+                text, answer_model, usage = flight.result()
+                if outcome["complete"] and not outcome["spliced"] and text and not no_store:
+                    response_cache.put(key, text, answer_model or "g4f", usage or estimate_usage(messages, text))
+
+            # A request that times out or loses its client gives its slots back at once, even while upstream stalls.
+            chunks, is_owner = in_flight.join(key, produce, store, None if admitted is None else lambda flight: admitted.release())
+            if not is_owner and admitted is not None: admitted.release(measured=False)
+            if not is_owner: config.log(f"Joined an identical in-flight request in '{mode}' mode.")
 
             if stream:
                 def sse_stream():
-                    completion_id, created_time = f"chatcmpl-{uuid.uuid4().hex}", int(time.time())
-                    model_name_reported = "g4f-stream"
+                    writer = event_writer(settings, f"chatcmpl-{uuid.uuid4().hex}", int(time.time()))
+                    answer = Aggregator(settings["max_response_chars"], settings["upstream_timeout_s"])
                     try:
-                        for chunk in get_g4f_response_stream():
-                            if chunk.model: model_name_reported = chunk.model
-                            if chunk.choices and chunk.choices[0].delta.content:
-                                response_chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created_time, "model": model_name_reported, "choices": [{"index": 0, "delta": {"content": chunk.choices[0].delta.content}, "finish_reason": None }]}
-                                yield f"data: {json.dumps(response_chunk)}\n\n"
+                        # Waiting with a timeout lets the writer flush coalesced deltas and send heartbeats while upstream stalls.
+                        while True:
+                            pending, done = chunks.take(answer.remaining(writer.timeout()))
+                            for delta in pending:
+                                if delta.model:
+                                    event = writer.switch_model(delta.model)
+                                    if event: yield event
+                                content = answer.add_delta(delta.content, delta.model, delta.usage)
+                                if content:
+                                    trace.delta(); writer.add(content)
+                            done = done or answer.truncated
+                            event = writer.poll(done)
+                            if event: yield event
+                            if done: break
+                            answer.check_deadline()
+                        if trace.deltas:
+                            trace.finish("ok", writer.encoder.model)
+                            yield writer.encoder.final(answer.finish_reason, answer.usage_or_estimate(messages))
+                        else: trace.finish("failed", error_type="no_response")
                     except Exception as e:
-                        app_gui.log(f"Error during stream generation: {e}")
-                    yield "data: [DONE]\n\n"
-                return Response(sse_stream(), mimetype='text/event-stream')
+                        config.log(f"Error during stream generation: {e}")
+                        trace.finish("failed", error_type=f"stream.{type(e).__name__}")
+                    finally:
+                        chunks.close()
+                        # Reached without a finish() only when the client went away mid-stream.
+                        trace.finish("cancelled")
+                    yield DONE
+                return Response(sse_stream(), mimetype='text/event-stream', headers={"X-Cache": "MISS"})
             else:
-                app_gui.log(f"Received non-streaming request in '{mode}' mode.")
-                full_response_chunks = list(get_g4f_response_stream())
-                if not full_response_chunks: return jsonify({"error": "Failed to generate a response from any provider."}), 500
-
-                full_text = "".join(chunk.choices[0].delta.content for chunk in full_response_chunks if chunk.choices and chunk.choices[0].delta.content)
-                last_chunk = full_response_chunks[-1]
-                
-                usage_data = None
-                if last_chunk.usage:
-                    usage_data = {"prompt_tokens": last_chunk.usage.prompt_tokens, "completion_tokens": last_chunk.usage.completion_tokens, "total_tokens": last_chunk.usage.total_tokens}
-                
-                api_response = {"id": f"chatcmpl-{uuid.uuid4().hex}", "object": "chat.completion", "created": int(time.time()), "model": last_chunk.model or "g4f", "choices": [{"index": 0, "message": { "role": "assistant", "content": full_text }, "finish_reason": "stop"}], "usage": usage_data}
-                return jsonify(api_response)
+                config.log(f"Received non-streaming request in '{mode}' mode.")
+                answer = Aggregator(settings["max_response_chars"], settings["upstream_timeout_s"])
+                try:
+                    while not answer.truncated:
+                        pending, done = chunks.take(answer.remaining())
+                        for delta in pending:
+                            if answer.add_delta(delta.content, delta.model, delta.usage): trace.delta()
+                        if done: break
+                        answer.check_deadline()
+                except UpstreamTimeout as e:
+                    trace.finish("failed", error_type="upstream_timeout")
+                    return jsonify({"error": str(e)}), 504
+                except Overloaded as e:
+                    if not answer.chars: return rejected(e, trace)
+                finally:
+                    chunks.close()
+                if not answer.chars:
+                    trace.finish("failed", error_type="no_response")
+                    return jsonify({"error": "Failed to generate a response from any provider."}), 500
+                trace.finish("ok", answer.model)
+                return jsonify(completion_body(f"chatcmpl-{uuid.uuid4().hex}", int(time.time()), answer.model or "g4f", answer.text(), answer.usage_or_estimate(messages), answer.finish_reason)), 200, {"X-Cache": "MISS"}
         except Exception as e:
-            app_gui.log(f"An unexpected error occurred in the main endpoint: {e}")
+            config.log(f"An unexpected error occurred in the main endpoint: {e}")
+            if trace is not None: trace.finish("failed", error_type="internal")
             return jsonify({"error": f"An internal server error occurred: {e}"}), 500
     return flask_app
 
-def run_server(app_instance, host='127.0.0.1', port=1337):
-    app = create_app(app_instance)
-    app.run(host=host, port=port, threaded=True)
\ No newline at end of file
+def stream_completion(messages, mode, model=None, provider=None, race_width=1, hedge_delay=0.0, outcome=None, log=None, slot=None):
+    # Yields g4f chunks for one conversation: the manual model, or the health-ordered AUTO list with fallback.
+    # `outcome` gets complete/spliced flags; `slot(model)` may return a context manager held around each upstream attempt.
+    # When a model dies mid-answer, the next one is asked to continue the partial text, so the output stays one answer.
+    outcome = {} if outcome is None else outcome
+    outcome.update(complete=False, spliced=False)
+    log = log or config.log
+    slot = slot or (lambda model_name: contextlib.nullcontext())
+    client = Client()
+    if mode == "Manual":
+        log(f"Manual mode request: {provider}/{model}")
+        try:
+            with slot(model):
+                yield from client.chat.completions.create(model=model, provider=provider, messages=messages, stream=True)
+            outcome["complete"] = True
+        except Exception as e:
+            log(f"Manual request with {provider}/{model} failed: {e}")
+        return
+    model_list = health_board.order(auto_models(mode))
+    log(f"Auto mode request with list: {model_list}")
+    streamed, overloaded = [], None
+    if race_width > 1:
+        open_stream = lambda model_name: _holding(slot, model_name, lambda: Client().chat.completions.create(model=model_name, messages=messages, stream=True))
+        succeeded, untried, committed = yield from _recording(race_streams(model_list[:race_width], open_stream, health_board, log, hedge_delay), streamed)
+        if succeeded:
+            outcome["complete"] = True; return
+        if committed: outcome["spliced"] = True
+        model_list = untried + model_list[race_width:]
+    for model_name in model_list:
+        started, ttft, partial = time.monotonic(), None, "".join(streamed)
+        try:
+            log(f"Attempting model: {model_name}" + (f" (continuing after {len(partial)} characters)" if partial else ""))
+            with slot(model_name):
+                if partial: chunks = trim_overlap(client.chat.completions.create(model=model_name, messages=continuation_messages(messages, partial), stream=True), partial)
+                else: chunks = client.chat.completions.create(model=model_name, messages=messages, stream=True)
+                for chunk in chunks:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        if ttft is None: ttft = time.monotonic() - started
+                        streamed.append(chunk.choices[0].delta.content)
+                    yield chunk
+            if ttft is None: raise RuntimeError("stream ended without any content")
+            health_board.record_success(model_name, ttft)
+            log(f"Success with model: {model_name}!")
+            outcome["complete"] = True
+            return
+        except Overloaded as e:
+            overloaded = e; health_board.release_probe(model_name)
+            log(f"Model {model_name} is at its concurrency cap; skipping it.")
+        except Exception as e:
+            health_board.record_failure(model_name, ttft, e)
+            if ttft is not None: outcome["spliced"] = True
+            log(f"Model {model_name} failed: {str(e)[:150]}...")
+    # Nothing was produced and at least one model was only busy: the caller should retry rather than report a failure.
+    if overloaded is not None and not streamed: raise overloaded
+
+def auto_models(mode):
+    return AUTO_PLUS_MODELS if mode == "AUTO+" else AUTO_MODELS
+
+def rejected(overloaded, trace):
+    config.log(f"Request rejected ({overloaded.reason}); retry after {overloaded.retry_after}s.")
+    trace.finish("rejected", error_type=f"admission.{overloaded.reason}")
+    return jsonify({"error": str(overloaded)}), 429, {"Retry-After": str(overloaded.retry_after)}
+
+def _holding(slot, model_name, open_stream):
+    # A raced stream that holds the model's slot while it is read; a model at its cap raises Overloaded on the first read.
+    with slot(model_name): yield from open_stream()
+
+def _recording(source, streamed):
+    # `yield from source` that also appends each content delta to `streamed`, returning the source's return value.
+    try:
+        while True:
+            try: chunk = next(source)
+            except StopIteration as stop: return stop.value
+            if chunk.choices and chunk.choices[0].delta.content: streamed.append(chunk.choices[0].delta.content)
+            yield chunk
+    finally:
+        source.close()
+
+def _state_metrics():
+    cache, coalesced = response_cache.stats(), in_flight.stats()["coalesced"] + in_flight_async.stats()["coalesced"]
+    health = health_board.snapshot()
+    yield "moreweb_cache_lookups_total", "counter", "Response cache lookups by result.", [({"result": "hit"}, cache["hits"]), ({"result": "miss"}, cache["misses"])]
+    yield "moreweb_cache_entries", "gauge", "Responses currently held in the memory cache.", [({}, cache["entries"])]
+    yield "moreweb_coalesced_requests_total", "counter", "Requests served by joining an identical in-flight generation.", [({}, coalesced)]
+    yield "moreweb_model_ttft_ewma_seconds", "gauge", "Smoothed time to first token used to order the AUTO lists.", [({"model": model}, state["ttft"]) for model, state in health.items() if state["ttft"] is not None]
+    yield "moreweb_model_success_rate", "gauge", "Smoothed upstream success rate per model.", [({"model": model}, state["success_rate"]) for model, state in health.items()]
+    requests_gate, model_gates = admission.requests.stats(), admission.model_stats()
+    yield "moreweb_admission_active", "gauge", "Requests holding an upstream slot, overall and per capped model.", [({"gate": "requests"}, requests_gate["active"])] + [({"gate": model}, gate["active"]) for model, gate in model_gates.items()]
+    yield "moreweb_admission_waiting", "gauge", "Requests queued for an upstream slot, overall and per capped model.", [({"gate": "requests"}, requests_gate["waiting"])] + [({"gate": model}, gate["waiting"]) for model, gate in model_gates.items()]
+    yield "moreweb_admission_rejected_total", "counter", "Requests turned away by admission control.", [({"reason": "queue_full"}, requests_gate["rejected"]), ({"reason": "queue_timeout"}, requests_gate["timed_out"])]
+    yield "moreweb_model_circuit_open", "gauge", "1 while a model's circuit breaker is open or half-open.", [({"model": model}, int(state["state"] != "closed")) for model, state in health.items()]
+
+telemetry.add_collector(_state_metrics)
+
+def parse_race_options(data):
+    # Returns (race_width, hedge_delay_ms, error) for the optional 'race' / 'hedge_delay_ms' request fields.
+    race, hedge_delay_ms = data.get("race", False), data.get("hedge_delay_ms", 0)
+    if isinstance(race, bool): race_width = DEFAULT_RACE_WIDTH if race else 1
+    elif isinstance(race, int) and race >= 1: race_width = race
+    else: return None, None, "The 'race' field must be a boolean or a positive integer."
+    if isinstance(hedge_delay_ms, bool) or not isinstance(hedge_delay_ms, (int, float)) or hedge_delay_ms < 0:
+        return None, None, "The 'hedge_delay_ms' field must be a non-negative number."
+    return race_width, hedge_delay_ms, None
+
+def completion_body(completion_id, created_time, model, content, usage, finish_reason="stop"):
+    return {"id": completion_id, "object": "chat.completion", "created": created_time, "model": model, "choices": [{"index": 0, "message": { "role": "assistant", "content": content }, "finish_reason": finish_reason}], "usage": usage}
+
+def cached_response(cached, stream, settings):
+    completion_id, created_time = f"chatcmpl-{uuid.uuid4().hex}", int(time.time())
+    if not stream: return jsonify(completion_body(completion_id, created_time, cached["model"], cached["content"], cached["usage"])), 200, {"X-Cache": "HIT"}
+    encoder = event_writer(settings, completion_id, created_time, cached["model"]).encoder
+    return Response([encoder.delta(cached["content"]) + encoder.final("stop", cached["usage"]) + DONE], mimetype='text/event-stream', headers={"X-Cache": "HIT"})
+
+def share_state(state_dir):
+    # Multi-worker mode (workers.py): model health and metrics live in one SQLite file that every worker process uses.
+    path = os.path.join(state_dir, "state.sqlite")
+    health_board.share(path); telemetry.share(path)
+
+def run_server(runtime_config, host='127.0.0.1', port=1337, cache_path=None, engine="flask", sock=None, ready=None, grace=SHUTDOWN_GRACE):
+    # engine="flask" serves through Werkzeug's threaded server; engine="asgi" uses the asyncio engine in asgi_server.py.
+    # `sock` is an already listening socket to serve on instead of binding host:port; `ready()` runs just before serving.
+    # On shutdown new connections are refused at once and open requests get `grace` seconds to finish.
+    global _server
+    if cache_path: response_cache.open_store(cache_path)
+    if engine == "asgi":
+        import asgi_server
+        _server = asgi_server.AsgiServer(runtime_config, host=host, port=port, sock=sock, grace=grace)
+    else:
+        _server = make_server(host, port, create_app(runtime_config), threaded=True, fd=sock.fileno() if sock is not None else None)
+    if ready is not None: ready()
+    try: _server.serve_forever()
+    finally:
+        server, _server = _server, None
+        if engine != "asgi":
+            server.server_close()
+            if sock is not None: sock.close()
+            drain(grace)
+
+def drain(timeout):
+    # Waits for the Flask engine's request threads, which are daemons and would otherwise die with the process.
+    deadline = time.monotonic() + timeout
+    while telemetry.IN_FLIGHT.value() > 0 and time.monotonic() < deadline: time.sleep(0.1)
+
+def stop_server():
+    # Both engines expose shutdown(); it blocks until the serve loop exits, so it must not run on a request thread.
+    server = _server
+    if server is not None: threading.Thread(target=server.shutdown, daemon=True).start()
@@ -0,0 +1,329 @@
+# asgi_server.py - Moreweb AI Runtime v0.1.0
+# asyncio serving engine: /v1/chat/completions runs natively on g4f's AsyncClient, every other route is bridged to the Flask app.
+
+import asyncio
+import inspect
+import io
+import json
+import sys
+import time
+import uuid
+from g4f.client import AsyncClient
+import api_server
+from api_server import SHUTDOWN_GRACE, auto_models, health_board, response_cache, admission, in_flight_async, parse_race_options, completion_body
+from response_cache import cache_key
+from admission import Overloaded, parse_priority, DEFAULT_PRIORITY
+from sse_encoder import event_writer, DONE
+from aggregation import Aggregator, UpstreamTimeout, estimate_usage
+from continuation import continuation_messages, trim_overlap_async
+from upstream_race import race_streams_async, has_content
+import telemetry
+from telemetry import RequestTrace
+
+class AsgiApp:
+    def __init__(self, runtime_config):
+        self.config = runtime_config
+        self.wsgi_app = api_server.create_app(runtime_config)
+        self.closing = False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan": return await self.lifespan(receive, send)
+        if scope["type"] != "http": return
+        if scope["path"] == "/v1/chat/completions" and scope["method"] == "POST":
+            trace_id = telemetry.new_trace_id(header(scope, b"x-request-id"))
+            return await self.chat_completions(scope, receive, tagged(send, trace_id), trace_id)
+        await self.call_wsgi(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.closing = True
+                await send({"type": "lifespan.shutdown.complete"}); return
+
+    async def chat_completions(self, scope, receive, send, trace_id):
+        if self.closing: return await send_json(send, 503, {"error": "The server is shutting down."})
+        settings = self.config.snapshot()
+        mode = settings["mode"]
+        model, provider = (settings["model"], settings["provider"]) if mode == "Manual" else (None, None)
+        try: data = json.loads(await read_body(receive) or b"null")
+        except ValueError: data = None
+        trace = RequestTrace(mode, isinstance(data, dict) and data.get("stream", False), trace_id, provider)
+        if not isinstance(data, dict):
+            trace.finish("rejected", error_type="bad_request")
+            return await send_json(send, 400, {"error": "The request body must be a JSON object."})
+        messages, stream = data.get("messages"), data.get("stream", False)
+        race_width, hedge_delay_ms, error = parse_race_options(data)
+        if not messages: error = "The 'messages' field is required."
+        if error:
+            trace.finish("rejected", error_type="bad_request")
+            return await send_json(send, 400, {"error": error})
+        cache_control = {directive.strip().lower() for directive in header(scope, b"cache-control").split(",")}
+        key = cache_key(messages, mode, model, provider)
+        cached = None if "no-cache" in cache_control else response_cache.get(key)
+        if cached is not None:
+            self.config.log(f"Cache hit in '{mode}' mode.")
+            trace.finish("cached", cached["model"])
+            return await self.send_cached(send, cached, stream)
+
+        # Requests that can join an identical in-flight generation add no upstream load, so they skip the queue.
+        client_id, priority = header(scope, b"x-client-id") or (scope.get("client") or ("", 0))[0], parse_priority(header(scope, b"x-priority"))
+        admitted = None
+        if not in_flight_async.has(key):
+            try: admitted = await admission.admit_async(client_id, priority, model, () if mode == "Manual" else auto_models(mode))
+            except Overloaded as e: return await self.send_rejected(send, e, trace)
+        generation = Generation(self.config, messages, mode, model, provider, race_width, hedge_delay_ms / 1000, client_id, priority)
+
+        async def produce():
+            # Runs once per flight as a task of its own; identical concurrent requests share what it yields.
+            try:
+                async for chunk in generation: yield chunk
+            finally:
+                if admitted is not None: admitted.release()
+
+        def store(flight):
+            text, answer_model, usage = flight.result()
+            if generation.cacheable() and text and "no-store" not in cache_control:
+                response_cache.put(key, text, answer_model or "g4f", usage or estimate_usage(messages, text))
+
+        # The last subscriber to leave (a disconnect or a timeout) cancels the flight and gives its slots back.
+        chunks, is_owner = in_flight_async.join(key, produce, store, None if admitted is None else lambda flight: admitted.release())
+        if not is_owner and admitted is not None: admitted.release(measured=False)
+        if not is_owner: self.config.log(f"Joined an identical in-flight request in '{mode}' mode.")
+        answer = Aggregator(settings["max_response_chars"], settings["upstream_timeout_s"])
+        try:
+            if stream: completed = await until_disconnect(receive, self.send_stream(send, chunks, answer, messages, trace))
+            else:
+                self.config.log(f"Received non-streaming request in '{mode}' mode.")
+                completed = await until_disconnect(receive, self.send_completion(send, chunks, answer, messages, trace))
+            if completed is None:
+                trace.finish("cancelled")
+                self.config.log("Client disconnected.")
+        finally:
+            chunks.close()
+
+    async def send_rejected(self, send, overloaded, trace):
+        self.config.log(f"Request rejected ({overloaded.reason}); retry after {overloaded.retry_after}s.")
+        trace.finish("rejected", error_type=f"admission.{overloaded.reason}")
+        await send_json(send, 429, {"error": str(overloaded)}, {b"retry-after": str(overloaded.retry_after).encode()})
+
+    async def send_stream(self, send, chunks, answer, messages, trace):
+        writer = event_writer(self.config.snapshot(), f"chatcmpl-{uuid.uuid4().hex}", int(time.time()))
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/event-stream; charset=utf-8"), (b"cache-control", b"no-cache"), (b"x-cache", b"MISS")]})
+        try:
+            # Waiting with a timeout lets the writer flush coalesced deltas and send heartbeats while upstream stalls.
+            while True:
+                pending, done = await chunks.take(answer.remaining(writer.timeout()))
+                event = ""
+                for delta in pending:
+                    if delta.model: event += writer.switch_model(delta.model)
+                    content = answer.add_delta(delta.content, delta.model, delta.usage)
+                    if content:
+                        trace.delta(); writer.add(content)
+                done = done or answer.truncated
+                event += writer.poll(done)
+                if event: await send({"type": "http.response.body", "body": event.encode("utf-8"), "more_body": True})
+                if done: break
+                answer.check_deadline()
+            if trace.deltas:
+                trace.finish("ok", writer.encoder.model)
+                await send({"type": "http.response.body", "body": writer.encoder.final(answer.finish_reason, answer.usage_or_estimate(messages)).encode("utf-8"), "more_body": True})
+            else: trace.finish("failed", error_type="no_response")
+        except Exception as e:
+            self.config.log(f"Error during stream generation: {e}")
+            trace.finish("failed", error_type=f"stream.{type(e).__name__}")
+        await send({"type": "http.response.body", "body": DONE.encode("utf-8"), "more_body": False})
+        return True
+
+    async def send_completion(self, send, chunks, answer, messages, trace):
+        try:
+            while not answer.truncated:
+                pending, done = await chunks.take(answer.remaining())
+                for delta in pending:
+                    if answer.add_delta(delta.content, delta.model, delta.usage): trace.delta()
+                if done: break
+                answer.check_deadline()
+        except UpstreamTimeout as e:
+            trace.finish("failed", error_type="upstream_timeout")
+            await send_json(send, 504, {"error": str(e)})
+            return True
+        except Overloaded as e:
+            if not answer.chars:
+                await self.send_rejected(send, e, trace); return True
+        if not answer.chars:
+            trace.finish("failed", error_type="no_response")
+            await send_json(send, 500, {"error": "Failed to generate a response from any provider."})
+            return True
+        trace.finish("ok", answer.model)
+        await send_json(send, 200, completion_body(f"chatcmpl-{uuid.uuid4().hex}", int(time.time()), answer.model or "g4f", answer.text(), answer.usage_or_estimate(messages), answer.finish_reason), {b"x-cache": b"MISS"})
+        return True
+
+    async def send_cached(self, send, cached, stream):
+        completion_id, created_time = f"chatcmpl-{uuid.uuid4().hex}", int(time.time())
+        if not stream: return await send_json(send, 200, completion_body(completion_id, created_time, cached["model"], cached["content"], cached["usage"]), {b"x-cache": b"HIT"})
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/event-stream; charset=utf-8"), (b"cache-control", b"no-cache"), (b"x-cache", b"HIT")]})
+        encoder = event_writer(self.config.snapshot(), completion_id, created_time, cached["model"]).encoder
+        event = encoder.delta(cached["content"]) + encoder.final("stop", cached["usage"]) + DONE
+        await send({"type": "http.response.body", "body": event.encode("utf-8"), "more_body": False})
+
+    async def call_wsgi(self, scope, receive, send):
+        # The remaining routes are small and non-streaming, so they run through Flask on a worker thread.
+        body = await read_body(receive)
+        environ = wsgi_environ(scope, body)
+        response = {}
+        def start_response(status, headers, exc_info=None): response.update(status=int(status.split(" ", 1)[0]), headers=headers)
+        def call():
+            result = self.wsgi_app(environ, start_response)
+            try: return b"".join(result)
+            finally:
+                if hasattr(result, "close"): result.close()
+        content = await asyncio.to_thread(call)
+        await send({"type": "http.response.start", "status": response["status"], "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in response["headers"]]})
+        await send({"type": "http.response.body", "body": content})
+
+class Generation:
+    # Async counterpart of api_server's stream_completion: iterating it yields the upstream chunks of one answer,
+    # folded into `answer` along the way so that a fallback model can be asked to continue the partial text.
+    def __init__(self, config, messages, mode, model, provider, race_width, hedge_delay, client_id="", priority=DEFAULT_PRIORITY):
+        self.config, self.messages, self.mode = config, messages, mode
+        self.client_id, self.priority = client_id, priority
+        self.manual_model, self.provider = model, provider
+        self.race_width, self.hedge_delay = race_width, hedge_delay
+        self.client = AsyncClient()
+        self.answer = Aggregator()
+        self.complete = self.spliced = False
+
+    def cacheable(self): return self.complete and not self.spliced and self.answer.chars > 0
+
+    async def open_stream(self, model, provider=None, messages=None):
+        kwargs = {"provider": provider} if provider else {}
+        response = self.client.chat.completions.create(model=model, messages=messages or self.messages, stream=True, **kwargs)
+        return await response if inspect.isawaitable(response) else response
+
+    async def open_held_stream(self, model):
+        # open_stream for racing: the stream holds the model's admission slot while it is read,
+        # and a model at its cap raises Overloaded on the first read.
+        async def held():
+            async with admission.model(model).hold_async(self.client_id, self.priority, 0):
+                async for chunk in await self.open_stream(model): yield chunk
+        return held()
+
+    async def __aiter__(self):
+        async for chunk in self.chunks():
+            self.answer.add(chunk); yield chunk
+
+    async def chunks(self):
+        log = self.config.log
+        if self.mode == "Manual":
+            log(f"Manual mode request: {self.provider}/{self.manual_model}")
+            try:
+                # The request handler already holds the model's admission slot.
+                async for chunk in await self.open_stream(self.manual_model, self.provider): yield chunk
+                self.complete = True
+            except Exception as e:
+                log(f"Manual request with {self.provider}/{self.manual_model} failed: {e}")
+            return
+        model_list, overloaded = health_board.order(auto_models(self.mode)), None
+        log(f"Auto mode request with list: {model_list}")
+        if self.race_width > 1:
+            raced = {}
+            async for chunk in race_streams_async(model_list[:self.race_width], self.open_held_stream, health_board, log, self.hedge_delay, raced): yield chunk
+            if raced["succeeded"]:
+                self.complete = True; return
+            if raced["committed"]: self.spliced = True
+            model_list = raced["untried"] + model_list[self.race_width:]
+        for model_name in model_list:
+            # Everything yielded so far has been folded into self.answer, so its text is the partial answer to continue.
+            started, ttft, partial = time.monotonic(), None, self.answer.text()
+            try:
+                log(f"Attempting model: {model_name}" + (f" (continuing after {len(partial)} characters)" if partial else ""))
+                async with admission.model(model_name).hold_async(self.client_id, self.priority, 0):
+                    if partial: chunks = trim_overlap_async(await self.open_stream(model_name, messages=continuation_messages(self.messages, partial)), partial)
+                    else: chunks = await self.open_stream(model_name)
+                    async for chunk in chunks:
+                        if ttft is None and has_content(chunk): ttft = time.monotonic() - started
+                        yield chunk
+                if ttft is None: raise RuntimeError("stream ended without any content")
+                health_board.record_success(model_name, ttft)
+                log(f"Success with model: {model_name}!")
+                self.complete = True; return
+            except Overloaded as e:
+                overloaded = e; health_board.release_probe(model_name)
+                log(f"Model {model_name} is at its concurrency cap; skipping it.")
+            except Exception as e:
+                health_board.record_failure(model_name, ttft, e)
+                if ttft is not None: self.spliced = True
+                log(f"Model {model_name} failed: {str(e)[:150]}...")
+        if overloaded is not None and not self.answer.chars: raise overloaded
+
+async def until_disconnect(receive, coroutine):
+    # Runs `coroutine` while watching for http.disconnect; a disconnect cancels it (and the upstream generation with it).
+    work = asyncio.ensure_future(coroutine)
+    async def watch():
+        while (await receive())["type"] != "http.disconnect": pass
+    watcher = asyncio.ensure_future(watch())
+    try:
+        done, _ = await asyncio.wait({work, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        if work in done: return work.result()
+        work.cancel()
+        try: await work
+        except (asyncio.CancelledError, Exception): pass
+        return None
+    finally:
+        watcher.cancel(); work.cancel()
+
+def tagged(send, trace_id):
+    # Wraps `send` so the response start carries the request's X-Request-ID header.
+    async def send_with_trace(message):
+        if message["type"] == "http.response.start": message = {**message, "headers": list(message.get("headers", [])) + [(b"x-request-id", trace_id.encode("latin-1"))]}
+        await send(message)
+    return send_with_trace
+
+async def read_body(receive):
+    body, more_body = b"", True
+    while more_body:
+        message = await receive()
+        if message["type"] == "http.disconnect": break
+        body += message.get("body", b""); more_body = message.get("more_body", False)
+    return body
+
+async def send_json(send, status, payload, extra_headers=None):
+    body = json.dumps(payload).encode("utf-8")
+    headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())] + list((extra_headers or {}).items())
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+def header(scope, name):
+    for key, value in scope["headers"]:
+        if key == name: return value.decode("latin-1")
+    return ""
+
+def wsgi_environ(scope, body):
+    server_name, server_port = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"], "SCRIPT_NAME": scope.get("root_path", ""), "PATH_INFO": scope["path"],
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"), "SERVER_NAME": server_name, "SERVER_PORT": str(server_port),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}", "REMOTE_ADDR": (scope.get("client") or ("", 0))[0],
+        "wsgi.version": (1, 0), "wsgi.url_scheme": scope.get("scheme", "http"), "wsgi.input": io.BytesIO(body), "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True, "wsgi.multiprocess": False, "wsgi.run_once": False, "CONTENT_LENGTH": str(len(body)),
+    }
+    for key, value in scope["headers"]:
+        name = key.decode("latin-1").upper().replace("-", "_")
+        if name == "CONTENT_TYPE": environ["CONTENT_TYPE"] = value.decode("latin-1")
+        elif name != "CONTENT_LENGTH":
+            key = f"HTTP_{name}"
+            environ[key] = f"{environ[key]}, {value.decode('latin-1')}" if key in environ else value.decode("latin-1")
+    return environ
+
+class AsgiServer:
+    # Mirrors the serve_forever()/shutdown() pair of Werkzeug's server so run_server/stop_server treat both engines alike.
+    def __init__(self, runtime_config, host='127.0.0.1', port=1337, sock=None, grace=SHUTDOWN_GRACE):
+        try: import uvicorn
+        except ImportError: raise RuntimeError("The ASGI engine requires uvicorn: pip install uvicorn")
+        config = uvicorn.Config(AsgiApp(runtime_config), host=host, port=port, log_level="error", lifespan="on", timeout_graceful_shutdown=grace)
+        self._server = uvicorn.Server(config); self._sock = sock
+
+    def serve_forever(self): self._server.run(sockets=[self._sock] if self._sock is not None else None)
+    def shutdown(self): self._server.should_exit = True
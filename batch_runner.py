@@ -0,0 +1,182 @@
+# batch_runner.py - Moreweb AI Runtime v0.1.0
+# Offline batch completions: JSONL in, JSONL out, through a bounded worker pool that can resume after a crash.
+
+import argparse
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+import api_server
+from response_cache import cache_key
+from aggregation import Aggregator
+
+DEFAULT_WORKERS = 8
+DEFAULT_MODEL_CONCURRENCY = 4   # simultaneous upstream calls per model within one batch
+DEFAULT_MAX_RETRIES = 2
+RETRY_BACKOFF = 2.0             # seconds before the first retry, doubled for each further one
+
+logger = logging.getLogger("moreweb.batch")
+jobs = {}
+
+class ModelLimiter:
+    def __init__(self, default_limit=DEFAULT_MODEL_CONCURRENCY, limits=None):
+        self.default_limit, self.limits = default_limit, dict(limits or {})
+        self._lock = threading.Lock(); self._semaphores = {}
+
+    def __call__(self, model):
+        with self._lock:
+            semaphore = self._semaphores.get(model)
+            if semaphore is None: semaphore = self._semaphores[model] = threading.BoundedSemaphore(self.limits.get(model, self.default_limit))
+        return semaphore
+
+class BatchJob:
+    # Each input line is either {"custom_id": ..., "body": {...chat request...}} (OpenAI batch format) or a bare chat request.
+    # The output file doubles as the checkpoint: lines already present there are skipped when the job is run again.
+    def __init__(self, input_path, output_path, mode="AUTO+", workers=DEFAULT_WORKERS, model_concurrency=None, default_model_concurrency=DEFAULT_MODEL_CONCURRENCY, max_retries=DEFAULT_MAX_RETRIES, log=None):
+        # Zero workers would finish at once with nothing processed, and a zero limit would block a model forever.
+        if workers < 1: raise ValueError("'workers' must be at least 1.")
+        if default_model_concurrency < 1 or any(limit < 1 for limit in (model_concurrency or {}).values()): raise ValueError("Model concurrency limits must be at least 1.")
+        if max_retries < 0: raise ValueError("'max_retries' must not be negative.")
+        self.id = f"batch_{uuid.uuid4().hex}"
+        self.input_path, self.output_path, self.mode = input_path, output_path, mode
+        self.workers, self.max_retries = workers, max_retries
+        self.limiter = ModelLimiter(default_model_concurrency, model_concurrency)
+        self.log = log or logger.info
+        self.status = "validating"; self.created_at = int(time.time()); self.completed_at = None
+        self.counts = {"total": 0, "completed": 0, "failed": 0, "skipped": 0}
+        self._lock = threading.Lock(); self._cancelled = threading.Event(); self._output = None
+
+    def as_dict(self):
+        with self._lock: counts = dict(self.counts)
+        return {"id": self.id, "object": "batch", "status": self.status, "input_file": self.input_path, "output_file": self.output_path, "mode": self.mode, "created_at": self.created_at, "completed_at": self.completed_at, "request_counts": counts}
+
+    def start(self):
+        jobs[self.id] = self
+        threading.Thread(target=self.run, daemon=True).start()
+        return self
+
+    def cancel(self):
+        self._cancelled.set()
+        if self.status == "in_progress": self.status = "cancelling"
+
+    def run(self):
+        try:
+            done = self._load_checkpoint()
+            self.status = "in_progress"
+            self.log(f"Batch {self.id} started: {self.input_path} -> {self.output_path} ({len(done)} already done)")
+            tasks = queue.Queue(maxsize=self.workers * 2)
+            threads = [threading.Thread(target=self._work, args=(tasks,), daemon=True) for _ in range(self.workers)]
+            for thread in threads: thread.start()
+            with open(self.output_path, "a", encoding="utf-8") as self._output, open(self.input_path, encoding="utf-8") as lines:
+                for line_number, line in enumerate(lines, 1):
+                    if self._cancelled.is_set(): break
+                    if not line.strip(): continue
+                    with self._lock: self.counts["total"] += 1
+                    custom_id, body, error = parse_line(line, line_number)
+                    if custom_id in done:
+                        with self._lock: self.counts["skipped"] += 1
+                    elif error: self._write(custom_id, None, error, 0)
+                    else: tasks.put((custom_id, body))
+                for _ in threads: tasks.put(None)
+                for thread in threads: thread.join()
+            self.status = "cancelled" if self._cancelled.is_set() else "completed"
+        except Exception as e:
+            self.status = "failed"; self.log(f"Batch {self.id} failed: {e}")
+        finally:
+            self.completed_at = int(time.time())
+            self.log(f"Batch {self.id} {self.status}: {self.as_dict()['request_counts']}")
+
+    def _load_checkpoint(self):
+        # Collects the custom_ids already written and drops a half-written last line left by a crash.
+        done = set()
+        if not os.path.exists(self.output_path): return done
+        with open(self.output_path, "rb+") as f:
+            valid_end = 0
+            for line in f:
+                if not line.endswith(b"\n"): break
+                try: done.add(json.loads(line)["custom_id"])
+                except (ValueError, KeyError, TypeError): pass
+                valid_end += len(line)
+            f.truncate(valid_end)
+        return done
+
+    def _work(self, tasks):
+        while True:
+            task = tasks.get()
+            if task is None: return
+            if self._cancelled.is_set(): continue
+            custom_id, body = task
+            for attempt in range(self.max_retries + 1):
+                if attempt: time.sleep(RETRY_BACKOFF * 2 ** (attempt - 1))
+                try:
+                    self._write(custom_id, self.complete(body), None, attempt + 1); break
+                except Exception as e:
+                    error = str(e)
+                    if attempt == self.max_retries or self._cancelled.is_set():
+                        self._write(custom_id, None, error, attempt + 1); break
+
+    def complete(self, body):
+        model, provider = body.get("model"), body.get("provider")
+        mode = "Manual" if model else self.mode
+        key = cache_key(body["messages"], mode, model, provider)
+        cached = api_server.response_cache.get(key)
+        if cached is not None: return api_server.completion_body(f"chatcmpl-{uuid.uuid4().hex}", int(time.time()), cached["model"], cached["content"], cached["usage"])
+        outcome, answer = {}, Aggregator()
+        for chunk in api_server.stream_completion(body["messages"], mode, model, provider, outcome=outcome, log=self.log, slot=self.limiter): answer.add(chunk)
+        if not answer.chars or not outcome["complete"]: raise RuntimeError("Failed to generate a response from any provider.")
+        usage_data = answer.usage_or_estimate(body["messages"])
+        if outcome["complete"] and not outcome["spliced"]: api_server.response_cache.put(key, answer.text(), answer.model or "g4f", usage_data)
+        return api_server.completion_body(f"chatcmpl-{uuid.uuid4().hex}", int(time.time()), answer.model or "g4f", answer.text(), usage_data)
+
+    def _write(self, custom_id, body, error, attempts):
+        record = {"id": f"batch_req_{uuid.uuid4().hex}", "custom_id": custom_id, "response": {"status_code": 200, "body": body} if body is not None else None, "error": {"message": error, "attempts": attempts} if error is not None else None}
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._output.write(line); self._output.flush()
+            self.counts["completed" if error is None else "failed"] += 1
+
+def parse_line(line, line_number):
+    # Returns (custom_id, body, error); lines without a custom_id are identified by their line number.
+    try: item = json.loads(line)
+    except ValueError as e: return f"line-{line_number}", None, f"Invalid JSON: {e}"
+    if not isinstance(item, dict): return f"line-{line_number}", None, "Each line must be a JSON object."
+    custom_id = str(item.get("custom_id") or f"line-{line_number}")
+    body = item.get("body", item)
+    if not isinstance(body, dict) or not body.get("messages"): return custom_id, None, "The 'messages' field is required."
+    return custom_id, body, None
+
+def parse_model_limits(values):
+    limits = {}
+    for value in values or []:
+        model, _, limit = value.rpartition("=")
+        if not model or not limit.isdigit() or int(limit) < 1: raise argparse.ArgumentTypeError(f"Expected MODEL=N, got '{value}'.")
+        limits[model] = int(limit)
+    return limits
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a JSONL file of chat requests through the runtime's fallback logic.")
+    parser.add_argument("input", help="JSONL file with one chat request per line.")
+    parser.add_argument("output", help="JSONL results file; re-running with the same file resumes where it stopped.")
+    parser.add_argument("--mode", choices=["Auto", "AUTO+"], default="AUTO+", help="Model list for lines that do not name a model.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--model-concurrency", action="append", metavar="MODEL=N", help="Per-model concurrency limit; may be repeated.")
+    parser.add_argument("--default-model-concurrency", type=int, default=DEFAULT_MODEL_CONCURRENCY)
+    parser.add_argument("--retries", type=int, default=DEFAULT_MAX_RETRIES)
+    parser.add_argument("--cache-path", help="SQLite file for the response cache, shared with the server.")
+    args = parser.parse_args(argv)
+    try: limits = parse_model_limits(args.model_concurrency)
+    except argparse.ArgumentTypeError as e: parser.error(str(e))
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s › %(message)s")
+    if args.cache_path: api_server.response_cache.open_store(args.cache_path)
+    try: job = BatchJob(args.input, args.output, args.mode, args.workers, limits, args.default_model_concurrency, args.retries)
+    except ValueError as e: parser.error(str(e))
+    try: job.run()
+    except KeyboardInterrupt: job.cancel()
+    return 0 if job.status == "completed" else 1
+
+if __name__ == "__main__":
+    raise SystemExit(main())
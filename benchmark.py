@@ -0,0 +1,152 @@
+# benchmark.py - Moreweb AI Runtime v0.1.0
+# Load generator for /v1/chat/completions: throughput, TTFT/latency percentiles, server CPU per token and memory growth.
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+DEFAULT_FAKE_UPSTREAM = "ttft=0.2,tps=50,tokens=100"
+STARTUP_TIMEOUT = 20      # seconds to wait for a spawned server to answer
+PERCENTILES = (0.5, 0.9, 0.99)
+
+def percentile(values, fraction):
+    if not values: return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+def scrape_process(url):
+    # Reads the server's own CPU and memory counters from /metrics; a process without /proc reports no RSS.
+    stats = {}
+    for line in requests.get(f"{url}/metrics", timeout=10).text.splitlines():
+        name, _, value = line.partition(" ")
+        if name in ("process_cpu_seconds_total", "process_resident_memory_bytes"): stats[name] = float(value)
+    return stats
+
+def one_request(session, url, run_id, index, stream, timeout):
+    # Every prompt is unique and marked no-store, so neither the response cache nor request coalescing hides upstream work.
+    payload = {"messages": [{"role": "user", "content": f"benchmark {run_id} request {index}"}], "stream": stream}
+    started, ttft, tokens, deltas = time.perf_counter(), None, None, 0
+    try:
+        with session.post(f"{url}/v1/chat/completions", json=payload, headers={"Cache-Control": "no-cache, no-store"}, stream=stream, timeout=timeout) as response:
+            if response.status_code != 200: return {"ok": False, "error": f"HTTP {response.status_code}"}
+            if stream:
+                for line in response.iter_lines():
+                    if not line.startswith(b"data: "): continue
+                    if line == b"data: [DONE]": break
+                    chunk = json.loads(line[6:])
+                    if chunk["choices"] and chunk["choices"][0]["delta"].get("content"):
+                        if ttft is None: ttft = time.perf_counter() - started
+                        deltas += 1
+                    if chunk.get("usage"): tokens = chunk["usage"]["completion_tokens"]
+                if ttft is None: return {"ok": False, "error": "empty stream"}
+            else:
+                body = response.json()
+                tokens = (body.get("usage") or {}).get("completion_tokens")
+                deltas = len(body["choices"][0]["message"]["content"].split())
+    except (requests.RequestException, ValueError, KeyError) as e:
+        return {"ok": False, "error": type(e).__name__}
+    return {"ok": True, "ttft": ttft, "latency": time.perf_counter() - started, "tokens": tokens if tokens is not None else deltas}
+
+def run_phase(url, total, concurrency, stream, timeout):
+    run_id = uuid.uuid4().hex[:8]
+    local = threading.local()
+    def work(index):
+        # One keep-alive session per worker thread.
+        if not hasattr(local, "session"): local.session = requests.Session()
+        return one_request(local.session, url, run_id, index, stream, timeout)
+    before = scrape_process(url); started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool: results = list(pool.map(work, range(total)))
+    elapsed = time.perf_counter() - started; after = scrape_process(url)
+    return summarize(results, elapsed, before, after, stream, concurrency)
+
+def summarize(results, elapsed, before, after, stream, concurrency):
+    ok = [result for result in results if result["ok"]]
+    errors = {}
+    for result in results:
+        if not result["ok"]: errors[result["error"]] = errors.get(result["error"], 0) + 1
+    tokens = sum(result["tokens"] for result in ok)
+    cpu = after.get("process_cpu_seconds_total", 0) - before.get("process_cpu_seconds_total", 0)
+    report = {"stream": stream, "concurrency": concurrency, "requests": len(results), "succeeded": len(ok), "errors": errors,
+              "elapsed_s": round(elapsed, 3), "requests_per_s": round(len(ok) / elapsed, 2), "tokens_per_s": round(tokens / elapsed, 1),
+              "server_cpu_s": round(cpu, 3), "server_cpu_us_per_token": round(cpu / tokens * 1e6, 1) if tokens else None}
+    for name, values in (("ttft", [result["ttft"] for result in ok if result["ttft"] is not None]), ("latency", [result["latency"] for result in ok])):
+        for fraction in PERCENTILES:
+            value = percentile(values, fraction)
+            report[f"{name}_p{int(fraction * 100)}_ms"] = round(value * 1000, 1) if value is not None else None
+    if "process_resident_memory_bytes" in after:
+        report["server_rss_mb"] = round(after["process_resident_memory_bytes"] / 2**20, 1)
+        report["server_rss_growth_mb"] = round((after["process_resident_memory_bytes"] - before.get("process_resident_memory_bytes", 0)) / 2**20, 1)
+    return report
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0)); return s.getsockname()[1]
+
+def start_server(engine, mode, fake_upstream, config_path=None, workers=None):
+    # Spawns headless.py on a free port with the fake provider and returns (process, base_url) once it answers.
+    port = free_port()
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "headless.py"), "--host", "127.0.0.1", "--port", str(port), "--engine", engine, "--mode", mode, "--fake-upstream", fake_upstream]
+    if config_path: command += ["--config", config_path]
+    if workers: command += ["--workers", str(workers)]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url, deadline = f"http://127.0.0.1:{port}", time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None: raise RuntimeError(f"The server exited during startup with code {process.returncode}.")
+        try:
+            requests.get(url, timeout=1); return process, url
+        except requests.RequestException: time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("The server did not start in time.")
+
+def print_report(report):
+    print(f"\n{'Streaming' if report['stream'] else 'Non-streaming'} - {report['requests']} requests at concurrency {report['concurrency']}")
+    print(f"  succeeded        {report['succeeded']}  errors {report['errors'] or 'none'}")
+    print(f"  throughput       {report['requests_per_s']} req/s, {report['tokens_per_s']} tokens/s")
+    if report["stream"]: print(f"  TTFT ms          p50 {report['ttft_p50_ms']}  p90 {report['ttft_p90_ms']}  p99 {report['ttft_p99_ms']}")
+    print(f"  latency ms       p50 {report['latency_p50_ms']}  p90 {report['latency_p90_ms']}  p99 {report['latency_p99_ms']}")
+    print(f"  server CPU       {report['server_cpu_s']} s total, {report['server_cpu_us_per_token']} us/token")
+    if "server_rss_mb" in report: print(f"  server memory    {report['server_rss_mb']} MB RSS ({report['server_rss_growth_mb']:+} MB during the run)")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark /v1/chat/completions, by default against a local server backed by the fake provider.")
+    parser.add_argument("--url", help="Benchmark an already running server instead of spawning one.")
+    parser.add_argument("--engine", choices=["flask", "asgi"], default="flask")
+    parser.add_argument("--mode", choices=["Auto", "AUTO+"], default="AUTO+")
+    parser.add_argument("--fake-upstream", default=DEFAULT_FAKE_UPSTREAM, metavar="SPEC", help="Fake provider settings for the spawned server (see fake_upstream.py).")
+    parser.add_argument("--config", help="Settings file for the spawned server, e.g. to raise max_active_requests.")
+    parser.add_argument("--workers", type=int, metavar="N", help="Run the spawned server as N worker processes (see headless.py --workers).")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per phase.")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--stream", choices=["on", "off", "both"], default="both")
+    parser.add_argument("--warmup", type=int, default=10, help="Requests sent before measuring.")
+    parser.add_argument("--timeout", type=float, default=120, help="Per-request timeout in seconds.")
+    parser.add_argument("--json", metavar="PATH", help="Also write the reports to this file.")
+    args = parser.parse_args(argv)
+
+    process = None
+    try:
+        if args.url: url = args.url.rstrip("/")
+        else:
+            process, url = start_server(args.engine, args.mode, args.fake_upstream, args.config, args.workers)
+            print(f"Started the {args.engine} engine at {url} with fake upstream '{args.fake_upstream}'" + (f" and {args.workers} workers." if args.workers else "."))
+        if args.warmup: run_phase(url, args.warmup, min(args.warmup, args.concurrency), True, args.timeout)
+        reports = []
+        for stream in {"on": [True], "off": [False], "both": [True, False]}[args.stream]:
+            reports.append(run_phase(url, args.requests, args.concurrency, stream, args.timeout)); print_report(reports[-1])
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f: json.dump(reports, f, indent=2)
+    finally:
+        if process is not None:
+            process.terminate(); process.wait(timeout=10)
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
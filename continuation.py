@@ -0,0 +1,52 @@
+# continuation.py - Moreweb AI Runtime v0.1.0
+# Mid-stream failover: asks the next model to continue a partial answer and trims any text it repeats.
+
+CONTINUE_PROMPT = "Continue your previous answer exactly where it stopped. Do not repeat any text that was already written and do not add a preamble."
+OVERLAP_WINDOW = 200   # characters of the continuation inspected for repeated text before any of it is released
+MIN_OVERLAP = 8        # shorter matches are more likely coincidence than repetition, so they are left alone
+
+def continuation_messages(messages, partial):
+    return list(messages) + [{"role": "assistant", "content": partial}, {"role": "user", "content": CONTINUE_PROMPT}]
+
+def overlap(partial, text):
+    # Length of the longest prefix of `text` that repeats the end of `partial`.
+    for size in range(min(len(partial), len(text)), MIN_OVERLAP - 1, -1):
+        if partial.endswith(text[:size]): return size
+    return 0
+
+class OverlapTrimmer:
+    # Holds back the continuation's first chunks until OVERLAP_WINDOW characters (or the end of the stream) have arrived,
+    # then drops whatever part of them repeats the partial answer. Later chunks pass straight through.
+    def __init__(self, partial):
+        self.partial = partial[-OVERLAP_WINDOW:]
+        self._held = []; self._held_chars = 0; self._released = False
+
+    def feed(self, chunk):
+        if self._released: return [chunk]
+        self._held.append(chunk)
+        if chunk.choices and chunk.choices[0].delta.content: self._held_chars += len(chunk.choices[0].delta.content)
+        return self.flush() if self._held_chars >= OVERLAP_WINDOW else []
+
+    def flush(self):
+        if self._released: return []
+        self._released = True
+        held, self._held = self._held, []
+        text = "".join(chunk.choices[0].delta.content for chunk in held if chunk.choices and chunk.choices[0].delta.content)
+        drop = overlap(self.partial, text)
+        for chunk in held:
+            if drop <= 0: break
+            content = chunk.choices[0].delta.content if chunk.choices else None
+            if not content: continue
+            chunk.choices[0].delta.content = content[drop:]; drop -= len(content)
+        return held
+
+def trim_overlap(chunks, partial):
+    trimmer = OverlapTrimmer(partial)
+    for chunk in chunks: yield from trimmer.feed(chunk)
+    yield from trimmer.flush()
+
+async def trim_overlap_async(chunks, partial):
+    trimmer = OverlapTrimmer(partial)
+    async for chunk in chunks:
+        for ready in trimmer.feed(chunk): yield ready
+    for ready in trimmer.flush(): yield ready
@@ -0,0 +1,92 @@
+# fake_upstream.py - Moreweb AI Runtime v0.1.0
+# Deterministic local stand-in for g4f's Client/AsyncClient, used by benchmark.py to measure the server without real providers.
+
+import asyncio
+import itertools
+import random
+import threading
+import time
+
+DEFAULTS = {"ttft": 0.2, "tps": 50.0, "tokens": 100, "failure_rate": 0.0, "midstream_failure_rate": 0.0, "seed": 0}
+
+class FakeUpstreamError(RuntimeError):
+    pass
+
+class _Namespace:
+    def __init__(self, **fields): self.__dict__.update(fields)
+
+def parse_spec(spec):
+    # "ttft=0.2,tps=50,tokens=100,failure_rate=0.05,midstream_failure_rate=0.01,seed=1"; omitted keys keep their defaults.
+    settings = dict(DEFAULTS)
+    for item in filter(None, (part.strip() for part in (spec or "").split(","))):
+        key, _, value = item.partition("=")
+        if key not in DEFAULTS: raise ValueError(f"Unknown fake upstream setting '{key}'.")
+        try: settings[key] = type(DEFAULTS[key])(value)
+        except ValueError: raise ValueError(f"Invalid value for '{key}': {value!r}")
+    return settings
+
+class FakeUpstream:
+    # Each call draws its outcome from its own RNG seeded by (seed, call number), so a run is reproducible
+    # for a given request order regardless of thread timing.
+    def __init__(self, **settings):
+        self.settings = {**DEFAULTS, **settings}
+        self._calls = itertools.count(); self._lock = threading.Lock()
+
+    def plan(self, model):
+        # Returns (token_count, fail_before_first_token, fail_after_n_tokens or None) for one upstream call.
+        with self._lock: call = next(self._calls)
+        s = self.settings; rng = random.Random(f"{s['seed']}:{call}")
+        if rng.random() < s["failure_rate"]: return 0, True, None
+        fail_after = rng.randint(1, max(1, s["tokens"] - 1)) if rng.random() < s["midstream_failure_rate"] else None
+        return s["tokens"], False, fail_after
+
+    def chunk(self, model, text=None, usage=None):
+        return _Namespace(model=model, usage=usage, choices=[_Namespace(delta=_Namespace(content=text), finish_reason=None)])
+
+    def usage(self, messages, tokens):
+        prompt_tokens = sum(len(str(message.get("content", "")).split()) for message in messages)
+        return _Namespace(prompt_tokens=prompt_tokens, completion_tokens=tokens, total_tokens=prompt_tokens + tokens)
+
+    def stream(self, model, messages):
+        tokens, fail_now, fail_after = self.plan(model)
+        time.sleep(self.settings["ttft"])
+        if fail_now: raise FakeUpstreamError(f"fake upstream failure for {model}")
+        interval = 1 / self.settings["tps"] if self.settings["tps"] > 0 else 0
+        for index in range(tokens):
+            if index == fail_after: raise FakeUpstreamError(f"fake mid-stream failure for {model}")
+            if index and interval: time.sleep(interval)
+            yield self.chunk(model, f"tok{index} ")
+        yield self.chunk(model, usage=self.usage(messages, tokens))
+
+    async def stream_async(self, model, messages):
+        tokens, fail_now, fail_after = self.plan(model)
+        await asyncio.sleep(self.settings["ttft"])
+        if fail_now: raise FakeUpstreamError(f"fake upstream failure for {model}")
+        interval = 1 / self.settings["tps"] if self.settings["tps"] > 0 else 0
+        for index in range(tokens):
+            if index == fail_after: raise FakeUpstreamError(f"fake mid-stream failure for {model}")
+            if index and interval: await asyncio.sleep(interval)
+            yield self.chunk(model, f"tok{index} ")
+        yield self.chunk(model, usage=self.usage(messages, tokens))
+
+    def client_classes(self):
+        # Returns (Client, AsyncClient) replacements that route every completion through this fake.
+        upstream = self
+        class Completions:
+            def create(self, model=None, messages=None, stream=False, provider=None, **kwargs):
+                return upstream.stream(model, messages or [])
+        class AsyncCompletions:
+            def create(self, model=None, messages=None, stream=False, provider=None, **kwargs):
+                return upstream.stream_async(model, messages or [])
+        class Client:
+            def __init__(self, *args, **kwargs): self.chat = _Namespace(completions=Completions())
+        class AsyncClient:
+            def __init__(self, *args, **kwargs): self.chat = _Namespace(completions=AsyncCompletions())
+        return Client, AsyncClient
+
+def install(spec):
+    # Swaps the g4f clients used by both serving engines for a FakeUpstream configured from `spec`.
+    import api_server, asgi_server
+    upstream = FakeUpstream(**parse_spec(spec))
+    api_server.Client, asgi_server.AsyncClient = upstream.client_classes()
+    return upstream
@@ -0,0 +1,76 @@
+# headless.py - Moreweb AI Runtime v0.1.0
+# Runs the API server without the GUI, e.g. on a machine with no display.
+
+import argparse
+import os
+import shutil
+import signal
+import socket
+import tempfile
+import api_server
+import telemetry
+import workers
+from runtime_config import RuntimeConfig, MODES
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the Moreweb AI Runtime API server without the GUI.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1337)
+    parser.add_argument("--engine", choices=["flask", "asgi"], default="flask")
+    parser.add_argument("--config", help="JSON settings file (mode, provider, model, admin_token); reloaded whenever it changes.")
+    parser.add_argument("--mode", choices=MODES, default="AUTO+")
+    parser.add_argument("--provider", default="", help="Provider used in Manual mode.")
+    parser.add_argument("--model", default="", help="Model used in Manual mode.")
+    parser.add_argument("--cache-path", help="SQLite file that keeps the response cache across restarts.")
+    parser.add_argument("--log-json", action="store_true", help="Write one JSON object per log line, including the request's trace ID.")
+    parser.add_argument("--fake-upstream", metavar="SPEC", help="Serve from the deterministic fake provider instead of g4f, e.g. 'ttft=0.2,tps=50,tokens=100' (see fake_upstream.py).")
+    parser.add_argument("--workers", type=int, metavar="N", help="Run N worker processes on the port under a supervisor (POSIX only); SIGHUP restarts them one at a time.")
+    parser.add_argument("--reuse-port", action="store_true", help="Bind with SO_REUSEPORT so that several processes can each own a socket on the port.")
+    parser.add_argument("--state-dir", help="Directory for the state shared by worker processes (model health, metrics and, without --cache-path, the response cache).")
+    parser.add_argument("--drain-timeout", type=float, default=api_server.SHUTDOWN_GRACE, help="Seconds open requests get to finish when the server stops.")
+    parser.add_argument("--worker-fd", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--ready-fd", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    telemetry.configure_logging(json_logs=args.log_json)
+    if args.fake_upstream is not None:
+        import fake_upstream
+        try: fake_upstream.install(args.fake_upstream)
+        except ValueError as e: parser.error(str(e))
+    if args.workers is not None:
+        if args.workers < 1: parser.error("--workers must be at least 1.")
+        if os.name != "posix": parser.error("--workers needs a POSIX system.")
+        return supervise(args)
+    config = RuntimeConfig(mode=args.mode, provider=args.provider, model=args.model)
+    if args.config: config.watch_file(args.config)
+    sock, ready = None, None
+    if args.worker_fd is not None: sock = socket.socket(fileno=args.worker_fd)
+    elif args.reuse_port: sock = workers.listening_socket(args.host, args.port, reuse_port=True)
+    if args.state_dir: api_server.share_state(args.state_dir)
+    if args.ready_fd is not None:
+        # A supervised worker: report readiness through the pipe, and drain on SIGINT too, since Ctrl+C reaches the whole process group.
+        ready = lambda: (os.write(args.ready_fd, b"1"), os.close(args.ready_fd))
+        signal.signal(signal.SIGINT, lambda signum, frame: api_server.stop_server())
+    signal.signal(signal.SIGTERM, lambda signum, frame: api_server.stop_server())
+    config.log(f"Server starting at http://{args.host}:{args.port} ({args.engine} engine, '{config.snapshot()['mode']}' mode, pid {os.getpid()})")
+    try: api_server.run_server(config, host=args.host, port=args.port, cache_path=args.cache_path, engine=args.engine, sock=sock, ready=ready, grace=args.drain_timeout)
+    except KeyboardInterrupt: pass
+    config.log("Server stopped.")
+
+def supervise(args):
+    # Workers get the same options plus a shared state directory; the cache joins it unless --cache-path names a file.
+    state_dir = args.state_dir or tempfile.mkdtemp(prefix="moreweb-state-")
+    argv = ["--host", args.host, "--port", str(args.port), "--engine", args.engine, "--mode", args.mode, "--provider", args.provider, "--model", args.model,
+            "--state-dir", state_dir, "--cache-path", args.cache_path or os.path.join(state_dir, "cache.sqlite"), "--drain-timeout", str(args.drain_timeout)]
+    if args.config: argv += ["--config", os.path.abspath(args.config)]
+    if args.log_json: argv.append("--log-json")
+    if args.fake_upstream is not None: argv += ["--fake-upstream", args.fake_upstream]
+    if args.reuse_port: argv.append("--reuse-port")
+    try:
+        sock = None if args.reuse_port else workers.listening_socket(args.host, args.port)
+        workers.Supervisor(workers.worker_command(argv), args.workers, sock, args.drain_timeout).run()
+    finally:
+        if not args.state_dir: shutil.rmtree(state_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
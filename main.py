@@ -2,22 +2,13 @@
 # Main graphical user interface for controlling the local AI server.
 
 import customtkinter as ctk
+import queue
 import threading
-import requests
-import g4f
 import api_server
+from model_catalog import catalog
+from runtime_config import RuntimeConfig
 
-def get_text_models():
-    text_providers = {}
-    for provider_class in g4f.Provider.__providers__:
-        try:
-            provider_name = provider_class.__name__
-            if getattr(provider_class, 'supports_gpt_35_turbo', False) or getattr(provider_class, 'supports_gpt_4', False) or getattr(provider_class, 'working', False):
-                if not getattr(provider_class, 'supports_image_generation', False) and provider_class.models:
-                    text_providers[provider_name] = provider_class.models
-        except Exception:
-            continue
-    return text_providers
+UI_POLL_MS = 100
 
 class MorewebRuntimeApp(ctk.CTk):
     def __init__(self):
@@ -33,7 +24,9 @@ class MorewebRuntimeApp(ctk.CTk):
 
         self.server_thread = None; self.is_server_running = False
         self.HOST = '127.0.0.1'; self.PORT = 1337
-        self.text_model_data = get_text_models()
+        # The server only ever talks to self.config; log lines and config changes reach Tk through ui_queue.
+        self.config = RuntimeConfig(); self.ui_queue = queue.Queue()
+        self.text_model_data = catalog.providers()
         self.provider_list = sorted(list(self.text_model_data.keys()))
 
         self.grid_columnconfigure(0, weight=1); self.grid_columnconfigure(1, weight=2); self.grid_rowconfigure(0, weight=1)
@@ -75,8 +68,12 @@ class MorewebRuntimeApp(ctk.CTk):
         self.provider_menu.grid(row=2, column=1, padx=10, pady=5, sticky="ew")
         ctk.CTkLabel(config_frame, text="Model:", font=self.label_font).grid(row=3, column=0, sticky="w", padx=0, pady=5)
         self.model_var = ctk.StringVar(value="")
-        self.model_menu = ctk.CTkOptionMenu(config_frame, variable=self.model_var, values=[])
+        self.model_menu = ctk.CTkOptionMenu(config_frame, variable=self.model_var, values=[], command=self.on_model_change)
         self.model_menu.grid(row=3, column=1, padx=10, pady=5, sticky="ew")
+        ctk.CTkLabel(config_frame, text="Engine:", font=self.label_font).grid(row=4, column=0, sticky="w", padx=0, pady=5)
+        self.engine_var = ctk.StringVar(value="flask")
+        self.engine_menu = ctk.CTkOptionMenu(config_frame, variable=self.engine_var, values=["flask", "asgi"])
+        self.engine_menu.grid(row=4, column=1, padx=10, pady=5, sticky="ew")
         
         self.right_frame = ctk.CTkFrame(self, corner_radius=15, fg_color="#242424")
         self.right_frame.grid(row=0, column=1, padx=(5, 10), pady=10, sticky="nsew")
@@ -89,26 +86,53 @@ class MorewebRuntimeApp(ctk.CTk):
         self.log_textbox = ctk.CTkTextbox(self.right_frame, state="disabled", corner_radius=10, font=self.monospace_font, border_width=0, fg_color="#1E1E1E")
         self.log_textbox.grid(row=1, column=0, padx=10, pady=(0,10), sticky="nsew")
 
+        self.config.add_log_listener(lambda message: self.ui_queue.put(lambda: self._append_log(message)))
+        self.config.add_change_listener(lambda values: self.ui_queue.put(lambda: self._apply_config(values)))
+        self.after(UI_POLL_MS, self._drain_ui_queue)
+
         if self.provider_list: self.on_provider_change(self.provider_var.get())
         self.on_mode_change(self.mode_var.get())
         self.update_ui_for_server_stopped()
 
     def on_mode_change(self, mode):
-        state = "normal" if mode == "Manual" else "disabled"
-        self.provider_menu.configure(state=state); self.model_menu.configure(state=state)
+        self.config.update(mode=mode)
+        self._set_manual_menus_state(mode)
         self.log(f"Mode switched to '{mode}'.")
 
     def on_provider_change(self, provider_name):
         models = self.text_model_data.get(provider_name, [])
         self.model_menu.configure(values=models)
         self.model_var.set(models[0] if models else "")
-    
+        self.config.update(provider=provider_name, model=self.model_var.get())
+
+    def on_model_change(self, model):
+        self.config.update(model=model)
+
+    def _set_manual_menus_state(self, mode):
+        state = "normal" if mode == "Manual" else "disabled"
+        self.provider_menu.configure(state=state); self.model_menu.configure(state=state)
+
+    def _apply_config(self, values):
+        # Mirrors changes made elsewhere (admin endpoint) back into the widgets without re-triggering their callbacks.
+        if values["provider"] != self.provider_var.get():
+            self.provider_var.set(values["provider"]); self.model_menu.configure(values=self.text_model_data.get(values["provider"], []))
+        if values["model"] != self.model_var.get(): self.model_var.set(values["model"])
+        if values["mode"] != self.mode_var.get():
+            self.mode_var.set(values["mode"]); self._set_manual_menus_state(values["mode"])
+
+    def _drain_ui_queue(self):
+        while True:
+            try: self.ui_queue.get_nowait()()
+            except queue.Empty: break
+        self.after(UI_POLL_MS, self._drain_ui_queue)
+
     def log(self, message):
-        def _append():
-            self.log_textbox.configure(state="normal")
-            self.log_textbox.insert("end", f"› {message}\n"); self.log_textbox.see("end")
-            self.log_textbox.configure(state="disabled")
-        self.after(0, _append)
+        self.config.log(message)
+
+    def _append_log(self, message):
+        self.log_textbox.configure(state="normal")
+        self.log_textbox.insert("end", f"› {message}\n"); self.log_textbox.see("end")
+        self.log_textbox.configure(state="disabled")
 
     def clear_log(self):
         self.log_textbox.configure(state="normal"); self.log_textbox.delete("0.0", "end")
@@ -127,24 +151,23 @@ class MorewebRuntimeApp(ctk.CTk):
         except ValueError:
             self.log("Error: Invalid port number."); return
 
-        self.server_thread = threading.Thread(target=lambda: api_server.run_server(self, host=self.HOST, port=self.PORT), daemon=True)
+        engine = self.engine_var.get()
+        self.server_thread = threading.Thread(target=lambda: api_server.run_server(self.config, host=self.HOST, port=self.PORT, engine=engine), daemon=True)
         self.server_thread.start()
         self.is_server_running = True
         self.update_ui_for_server_running()
-        self.log(f"Server starting at http://{self.HOST}:{self.PORT}")
+        self.log(f"Server starting at http://{self.HOST}:{self.PORT} ({engine} engine)")
 
     def stop_server(self):
-        try: requests.post(f'http://{self.HOST}:{self.PORT}/shutdown', timeout=1)
-        except requests.exceptions.RequestException: pass
-        finally:
-            self.server_thread = None; self.is_server_running = False
-            self.update_ui_for_server_stopped()
-            self.log("Server shutdown requested.")
+        api_server.stop_server()
+        self.server_thread = None; self.is_server_running = False
+        self.update_ui_for_server_stopped()
+        self.log("Server shutdown requested.")
 
     def update_ui_for_server_running(self):
         self.start_stop_button.configure(text="Stop Server", fg_color="#D32F2F", hover_color="#B71C1C")
         self.status_label.configure(text="Running", text_color="#00C853")
-        self.port_entry.configure(state="disabled")
+        self.port_entry.configure(state="disabled"); self.engine_menu.configure(state="disabled")
         self.url_entry.configure(state="normal")
         self.url_entry.delete(0, "end"); self.url_entry.insert(0, f"http://{self.HOST}:{self.PORT}/v1/chat/completions")
         self.url_entry.configure(state="disabled", text_color="lightgray")
@@ -154,13 +177,9 @@ class MorewebRuntimeApp(ctk.CTk):
         hover_color = ctk.ThemeManager.theme["CTkButton"]["hover_color"]
         self.start_stop_button.configure(text="Start Server", fg_color=default_color, hover_color=hover_color)
         self.status_label.configure(text="Stopped", text_color="#D32F2F")
-        self.port_entry.configure(state="normal")
+        self.port_entry.configure(state="normal"); self.engine_menu.configure(state="normal")
         self.url_entry.configure(state="normal"); self.url_entry.delete(0, "end"); self.url_entry.insert(0, "")
         self.url_entry.configure(state="disabled")
 
-    def get_current_mode(self): return self.mode_var.get()
-    def get_manual_provider(self): return self.provider_var.get()
-    def get_manual_model(self): return self.model_var.get()
-
 if __name__ == "__main__":
     MorewebRuntimeApp().mainloop()
\ No newline at end of file
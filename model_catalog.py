@@ -0,0 +1,102 @@
+# model_catalog.py - Moreweb AI Runtime v0.1.0
+# Lazily built provider/model catalog, persisted per g4f version and refreshed in the background.
+
+import hashlib
+import json
+import os
+import threading
+import time
+from importlib import metadata
+
+CATALOG_FORMAT = 1
+REFRESH_AFTER = 24 * 3600.0   # a cached catalog older than this is served once more while a fresh one is built
+DEFAULT_PATH = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "moreweb-runtime", "model_catalog.json")
+
+def g4f_version():
+    try: return metadata.version("g4f")
+    except metadata.PackageNotFoundError: return "unknown"
+
+def get_text_models():
+    # Walks every g4f provider class; slow, which is why the result is cached on disk.
+    import g4f
+    text_providers = {}
+    for provider_class in g4f.Provider.__providers__:
+        try:
+            provider_name = provider_class.__name__
+            if getattr(provider_class, 'supports_gpt_35_turbo', False) or getattr(provider_class, 'supports_gpt_4', False) or getattr(provider_class, 'working', False):
+                if not getattr(provider_class, 'supports_image_generation', False) and provider_class.models:
+                    text_providers[provider_name] = [str(model) for model in provider_class.models]
+        except Exception:
+            continue
+    return text_providers
+
+class ModelCatalog:
+    def __init__(self, path=DEFAULT_PATH, builder=get_text_models):
+        self.path, self.builder = path, builder
+        self._lock = threading.Lock(); self._refreshing = False
+        self._data = None; self._models = None; self.etag = None
+
+    def providers(self):
+        return self._load()["providers"]
+
+    def models(self):
+        # OpenAI-style model objects, one per model id; `providers` lists every provider that serves it.
+        self._load()
+        return self._models
+
+    def model(self, model_id):
+        return next((model for model in self.models() if model["id"] == model_id), None)
+
+    def _load(self):
+        data = self._data
+        if data is None:
+            with self._lock:
+                if self._data is None: self._set(self._read_disk() or self._build())
+                data = self._data
+        if time.time() - data["built"] > REFRESH_AFTER: self.refresh_in_background()
+        return data
+
+    def refresh_in_background(self):
+        with self._lock:
+            if self._refreshing: return
+            self._refreshing = True
+        def refresh():
+            try:
+                data = self._build()
+                with self._lock: self._set(data)
+            except Exception:
+                pass
+            finally:
+                self._refreshing = False
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def _set(self, data):
+        owners = {}
+        for provider in sorted(data["providers"]):
+            for model_id in data["providers"][provider]: owners.setdefault(model_id, []).append(provider)
+        models = [{"id": model_id, "object": "model", "created": int(data["built"]), "owned_by": providers[0], "providers": providers} for model_id, providers in sorted(owners.items())]
+        # Only the provider/model mapping goes into the ETag: `created` is the build time, and a refresh that finds
+        # the same catalog must not invalidate every client's copy.
+        self.etag = hashlib.sha256(json.dumps(sorted(owners.items()), separators=(",", ":")).encode("utf-8")).hexdigest()[:32]
+        self._data, self._models = data, models
+
+    def _read_disk(self):
+        try:
+            with open(self.path, encoding="utf-8") as f: data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("format") != CATALOG_FORMAT or data.get("g4f_version") != g4f_version(): return None
+        return data
+
+    def _build(self):
+        data = {"format": CATALOG_FORMAT, "g4f_version": g4f_version(), "built": time.time(), "providers": self.builder()}
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            temporary = f"{self.path}.{os.getpid()}.tmp"
+            with open(temporary, "w", encoding="utf-8") as f: json.dump(data, f)
+            os.replace(temporary, self.path)
+        except OSError:
+            pass
+        return data
+
+catalog = ModelCatalog()
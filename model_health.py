@@ -0,0 +1,151 @@
+# model_health.py - Moreweb AI Runtime v0.1.0
+# Per-model health scoreboard used to order the AUTO/AUTO+ fallback lists.
+
+import json
+import sqlite3
+import threading
+import time
+
+EWMA_ALPHA = 0.3            # weight of the newest sample in the TTFT / success averages
+DEFAULT_TTFT = 5.0          # seconds assumed for a model that has never produced a token
+FAILURE_THRESHOLD = 3       # consecutive failures that trip the breaker
+BASE_COOLDOWN = 30.0        # first cooldown after tripping, doubled on every failed probe
+MAX_COOLDOWN = 600.0
+PROBE_TIMEOUT = 120.0       # a half-open probe that never reports back is released after this
+
+class ModelHealth:
+    def __init__(self):
+        self.ttft = None; self.success_rate = 1.0
+        self.consecutive_failures = 0; self.state = "closed"
+        self.cooldown = BASE_COOLDOWN; self.open_until = 0.0; self.probe_started = None
+
+    def score(self):
+        # Expected wait until a usable token: slow or unreliable models sink to the bottom.
+        return (self.ttft if self.ttft is not None else DEFAULT_TTFT) / max(self.success_rate, 0.05)
+
+    def as_dict(self):
+        return {"state": self.state, "ttft": self.ttft, "success_rate": round(self.success_rate, 3), "consecutive_failures": self.consecutive_failures, "open_until": self.open_until if self.state != "closed" else None}
+
+    @classmethod
+    def from_dict(cls, fields):
+        health = cls(); health.__dict__.update(fields)
+        return health
+
+class HealthBoard:
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock; self._lock = threading.Lock(); self._models = {}; self._listeners = []
+        self._db = None
+
+    def share(self, path):
+        # Multi-worker mode: keeps the scoreboard in the SQLite file at `path` so every worker process sees the same
+        # TTFTs and breaker states. Deadlines switch to wall-clock time, the only clock the processes have in common.
+        db = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")   # in WAL mode this only risks the last commits on power loss, never corruption
+        db.execute("CREATE TABLE IF NOT EXISTS model_health (model TEXT PRIMARY KEY, state TEXT NOT NULL)")
+        with self._lock: self._db = db; self._clock = time.time; self._models = {}
+
+    def _update(self, models, change):
+        # Runs change() on the state of `models` (None = all) under the lock and returns its result. With a shared store
+        # the rows are first read without a write lock; only if change() modifies some of them is it run again on fresh
+        # rows inside a write transaction, so concurrent workers cannot lose updates, and just those rows are written.
+        with self._lock:
+            if self._db is None: return change()
+            before = self._load(models)
+            result = change()
+            if self._dump(models) == before: return result
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                before = self._load(models)
+                result = change()
+                self._db.executemany("INSERT OR REPLACE INTO model_health (model, state) VALUES (?, ?)",
+                                     [(model, state) for model, state in self._dump(models).items() if before.get(model) != state])
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK"); raise
+            return result
+
+    def _load(self, models):
+        # Replaces the cached state of `models` with the stored rows and returns them as stored.
+        query = "SELECT model, state FROM model_health"
+        if models is not None: query += f" WHERE model IN ({','.join('?' * len(models))})"
+        rows = dict(self._db.execute(query, list(models or [])).fetchall())
+        if models is None: self._models = {}
+        else:
+            for model in models: self._models.pop(model, None)
+        for model, state in rows.items(): self._models[model] = ModelHealth.from_dict(json.loads(state))
+        return rows
+
+    def _dump(self, models):
+        return {model: json.dumps(vars(health)) for model, health in self._models.items() if models is None or model in models}
+
+    def add_listener(self, listener):
+        # listener(model, ok, ttft, error) is called after every recorded attempt.
+        self._listeners.append(listener)
+
+    def _get(self, model):
+        health = self._models.get(model)
+        if health is None: health = self._models[model] = ModelHealth()
+        return health
+
+    def order(self, model_list):
+        # Returns the models worth trying for one request, fastest healthy model first. A recovering model whose probe
+        # this request claims goes first instead: sorted by its poor score it would rarely be reached, and its probe
+        # slot would stay taken until PROBE_TIMEOUT without the model ever being tried.
+        now = self._clock()
+        def change():
+            candidates, tripped, probe = [], [], []
+            for index, model in enumerate(model_list):
+                health = self._get(model)
+                if health.state == "open" and now >= health.open_until: health.state = "half_open"
+                if health.state == "half_open":
+                    # Only a single in-flight request may probe a recovering model, and a request probes one model at most.
+                    if probe or (health.probe_started is not None and now - health.probe_started < PROBE_TIMEOUT): continue
+                    health.probe_started = now; probe.append(model); continue
+                elif health.state == "open":
+                    tripped.append((health.open_until, index, model)); continue
+                candidates.append((health.score(), index, model))
+            if not candidates and not probe and tripped:
+                # Everything is tripped: probe the model whose cooldown ends soonest rather than failing outright.
+                _, _, model = min(tripped)
+                health = self._models[model]; health.state = "half_open"; health.probe_started = now
+                return [model]
+            return probe + [model for _, _, model in sorted(candidates)]
+        return self._update(model_list, change)
+
+    def record_success(self, model, ttft=None):
+        def change():
+            health = self._get(model)
+            if ttft is not None: health.ttft = ttft if health.ttft is None else EWMA_ALPHA * ttft + (1 - EWMA_ALPHA) * health.ttft
+            health.success_rate = EWMA_ALPHA + (1 - EWMA_ALPHA) * health.success_rate
+            health.consecutive_failures = 0; health.state = "closed"
+            health.cooldown = BASE_COOLDOWN; health.probe_started = None
+        self._update([model], change)
+        for listener in self._listeners: listener(model, True, ttft, None)
+
+    def record_failure(self, model, ttft=None, error=None):
+        now = self._clock()
+        def change():
+            health = self._get(model)
+            if ttft is not None: health.ttft = ttft if health.ttft is None else EWMA_ALPHA * ttft + (1 - EWMA_ALPHA) * health.ttft
+            health.success_rate = (1 - EWMA_ALPHA) * health.success_rate
+            health.consecutive_failures += 1
+            if health.state == "half_open":
+                health.cooldown = min(health.cooldown * 2, MAX_COOLDOWN)
+                health.state = "open"; health.open_until = now + health.cooldown
+            elif health.consecutive_failures >= FAILURE_THRESHOLD:
+                health.state = "open"; health.open_until = now + health.cooldown
+            health.probe_started = None
+        self._update([model], change)
+        for listener in self._listeners: listener(model, False, ttft, error)
+
+    def release_probe(self, model):
+        # For an attempt that ended without telling anything about the model (a cancelled race loser, a model at its
+        # concurrency cap): frees its half-open probe slot for the next request and leaves the score alone.
+        def change():
+            health = self._models.get(model)
+            if health is not None: health.probe_started = None
+        self._update([model], change)
+
+    def snapshot(self):
+        return self._update(None, lambda: {model: health.as_dict() for model, health in self._models.items()})
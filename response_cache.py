@@ -0,0 +1,80 @@
+# response_cache.py - Moreweb AI Runtime v0.1.0
+# Size-bounded LRU/TTL cache of finished completions, optionally backed by a SQLite file.
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 512
+DEFAULT_TTL = 3600.0
+DISK_PRUNE_EVERY = 64   # puts between two trims of the on-disk store
+
+def cache_key(messages, mode, model=None, provider=None):
+    # Canonical JSON so that key order and whitespace in the request body never change the hash.
+    canonical = json.dumps({"messages": messages, "mode": mode, "model": model, "provider": provider}, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL, path=None):
+        self.max_entries, self.ttl = max_entries, ttl
+        self.hits = self.misses = 0
+        self._lock = threading.Lock(); self._entries = OrderedDict()
+        self._db = None; self._puts = 0
+        if path: self.open_store(path)
+
+    def open_store(self, path):
+        # WAL and a busy timeout let several worker processes share one store: a miss in one worker's memory
+        # falls through to the rows written by the others.
+        db = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, created REAL NOT NULL, accessed REAL NOT NULL, entry TEXT NOT NULL)")
+        db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        db.commit()
+        with self._lock: self._db = db
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry["created"] > self.ttl:
+                del self._entries[key]; entry = None
+            if entry is None and self._db is not None:
+                row = self._db.execute("SELECT entry FROM responses WHERE key = ? AND created >= ?", (key, now - self.ttl)).fetchone()
+                if row:
+                    entry = json.loads(row[0]); self._remember(key, entry)
+                    self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key)); self._db.commit()
+            if entry is None:
+                self.misses += 1; return None
+            self._entries.move_to_end(key); self.hits += 1
+            return entry
+
+    def put(self, key, content, model, usage=None):
+        entry = {"content": content, "model": model, "usage": usage, "created": time.time()}
+        with self._lock:
+            self._remember(key, entry)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO responses (key, created, accessed, entry) VALUES (?, ?, ?, ?)", (key, entry["created"], entry["created"], json.dumps(entry)))
+                self._puts += 1
+                if self._puts % DISK_PRUNE_EVERY == 0: self._prune_store(entry["created"])
+                self._db.commit()
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry; self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries: self._entries.popitem(last=False)
+
+    def _prune_store(self, now):
+        # The disk store keeps a few times more entries than memory; least recently used rows go first.
+        self._db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        self._db.execute("DELETE FROM responses WHERE key NOT IN (SELECT key FROM responses ORDER BY accessed DESC LIMIT ?)", (self.max_entries * 4,))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None: self._db.execute("DELETE FROM responses"); self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries), "max_entries": self.max_entries, "ttl": self.ttl, "persistent": self._db is not None}
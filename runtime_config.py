@@ -0,0 +1,86 @@
+# runtime_config.py - Moreweb AI Runtime v0.1.0
+# Thread-safe server settings shared by the GUI, the headless entry point and the admin endpoint.
+
+import hmac
+import ipaddress
+import json
+import logging
+import os
+import threading
+import time
+
+MODES = ("Manual", "Auto", "AUTO+")
+NUMBER_DEFAULTS = {"stream_coalesce_ms": 0, "stream_coalesce_bytes": 1024, "stream_heartbeat_s": 15,
+                   "max_active_requests": 64, "max_queued_requests": 256, "queue_timeout_s": 30,
+                   "max_response_chars": 0, "upstream_timeout_s": 300}
+SETTINGS = ("mode", "provider", "model", "admin_token", "model_concurrency") + tuple(NUMBER_DEFAULTS)
+
+logger = logging.getLogger("moreweb")
+
+class RuntimeConfig:
+    def __init__(self, mode="AUTO+", provider="", model="", admin_token=None):
+        self._lock = threading.Lock()
+        self._values = {}
+        self._log_listeners, self._change_listeners = [], []
+        self._watch_path = None; self._watch_mtime = None
+        self.update(mode=mode, provider=provider, model=model, admin_token=admin_token, model_concurrency={}, **NUMBER_DEFAULTS)
+
+    def snapshot(self):
+        # Settings are replaced wholesale on every update, so a request reads one consistent dict without locking.
+        return self._values
+
+    def public_snapshot(self):
+        return {key: value for key, value in self._values.items() if key != "admin_token"}
+
+    def update(self, **changes):
+        unknown = set(changes) - set(SETTINGS)
+        if unknown: raise ValueError(f"Unknown setting(s): {', '.join(sorted(unknown))}")
+        if "mode" in changes and changes["mode"] not in MODES: raise ValueError(f"'mode' must be one of {', '.join(MODES)}.")
+        for key in ("provider", "model"):
+            if key in changes and not isinstance(changes[key], str): raise ValueError(f"'{key}' must be a string.")
+        if "admin_token" in changes and changes["admin_token"] is not None and not isinstance(changes["admin_token"], str): raise ValueError("'admin_token' must be a string or null.")
+        for key in NUMBER_DEFAULTS:
+            if key in changes and (isinstance(changes[key], bool) or not isinstance(changes[key], (int, float)) or changes[key] < 0): raise ValueError(f"'{key}' must be a non-negative number.")
+        if "model_concurrency" in changes and not (isinstance(changes["model_concurrency"], dict) and all(isinstance(limit, int) and not isinstance(limit, bool) and limit >= 1 for limit in changes["model_concurrency"].values())):
+            raise ValueError("'model_concurrency' must map model names to positive integers.")
+        with self._lock:
+            values = dict(self._values); values.update(changes)
+            self._values = values
+            listeners = list(self._change_listeners)
+        for listener in listeners: listener(self.public_snapshot())
+
+    def load_file(self, path):
+        with open(path, encoding="utf-8") as f: settings = json.load(f)
+        if not isinstance(settings, dict): raise ValueError(f"{path} must contain a JSON object.")
+        self.update(**settings)
+
+    def watch_file(self, path, interval=2.0):
+        # Loads `path` now and re-applies it whenever its modification time changes.
+        self._watch_path, self._watch_mtime = path, os.path.getmtime(path)
+        self.load_file(path)
+        threading.Thread(target=self._watch, args=(interval,), daemon=True).start()
+
+    def _watch(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                mtime = os.path.getmtime(self._watch_path)
+                if mtime == self._watch_mtime: continue
+                self._watch_mtime = mtime; self.load_file(self._watch_path)
+                self.log(f"Reloaded configuration from {self._watch_path}.")
+            except (OSError, ValueError) as e:
+                self.log(f"Could not reload configuration from {self._watch_path}: {e}")
+
+    def authorize(self, remote_addr, authorization):
+        # With an admin token set it must be presented as a bearer token; without one, only loopback clients may administer.
+        token = self._values.get("admin_token")
+        if token: return hmac.compare_digest((authorization or "").encode(), f"Bearer {token}".encode())
+        try: return ipaddress.ip_address(remote_addr or "").is_loopback
+        except ValueError: return False
+
+    def add_log_listener(self, listener): self._log_listeners.append(listener)
+    def add_change_listener(self, listener): self._change_listeners.append(listener)
+
+    def log(self, message):
+        logger.info(message)
+        for listener in self._log_listeners: listener(message)
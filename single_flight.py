@@ -0,0 +1,216 @@
+# single_flight.py - Moreweb AI Runtime v0.1.0
+# Coalesces identical in-flight requests onto a single upstream generator.
+
+import asyncio
+import contextvars
+import threading
+from aggregation import usage_dict
+
+COMPACT_EVERY = 64   # unmerged deltas every subscriber must have read before they are merged
+
+class Delta:
+    # What a flight keeps of a g4f chunk. The chunk objects themselves are dropped as soon as they arrive.
+    __slots__ = ("content", "model", "usage")
+    def __init__(self, content=None, model=None, usage=None):
+        self.content, self.model, self.usage = content, model, usage
+
+    @classmethod
+    def from_chunk(cls, chunk):
+        return cls(chunk.choices[0].delta.content if chunk.choices else None, chunk.model, usage_dict(chunk.usage) if chunk.usage else None)
+
+class Flight:
+    def __init__(self, on_done, on_complete=None, on_abandon=None):
+        self._cond = threading.Condition(); self._on_done, self._on_complete, self._on_abandon = on_done, on_complete, on_abandon
+        self._deltas = []; self._merged = 0; self._done = False; self._error = None
+        self._subscriptions = set(); self._abandoned = False
+
+    def attach(self):
+        with self._cond:
+            # A flight whose last subscriber left has stopped pulling upstream and can no longer be joined.
+            if self._abandoned: return False
+            subscription = self._subscribe(); self._subscriptions.add(subscription)
+            return subscription
+
+    def _subscribe(self): return Subscription(self)
+
+    def _abandon(self):
+        # Called once, without the lock, when the last subscriber leaves before the flight is done.
+        if self._on_abandon is not None: self._on_abandon(self)
+
+    def start(self, source):
+        # The pump runs in a copy of the owner's context so its logs and metrics stay attributed to the owning request.
+        threading.Thread(target=contextvars.copy_context().run, args=(self._pump, source), daemon=True).start()
+
+    def _pump(self, source):
+        try:
+            for chunk in source:
+                delta = Delta.from_chunk(chunk)
+                with self._cond:
+                    if not self._subscriptions:
+                        self._abandoned = True; break
+                    self._deltas.append(delta); self._cond.notify_all()
+        except Exception as e:
+            self._error = e
+        finally:
+            if self._abandoned and hasattr(source, "close"): source.close()
+            if self._on_complete is not None and self._error is None and not self._abandoned: self._on_complete(self)
+            with self._cond: self._done = True; self._cond.notify_all()
+            self._on_done(self)
+
+    def _compact(self):
+        # Merges what every subscriber has read into one delta per run of the same model: late joiners still get
+        # the whole answer, but a long one is held as a few strings rather than one object per token.
+        read = min((subscription._index for subscription in self._subscriptions), default=len(self._deltas))
+        if read - self._merged < COMPACT_EVERY: return
+        merged, run = [], []
+        for delta in self._deltas[:read] + [None]:
+            if run and (delta is None or delta.model != run[0].model):
+                usage = next((item.usage for item in reversed(run) if item.usage), None)
+                merged.append(Delta("".join(item.content for item in run if item.content) or None, run[0].model, usage)); run = []
+            if delta is not None: run.append(delta)
+        self._deltas[:read] = merged
+        for subscription in self._subscriptions: subscription._index -= read - len(merged)
+        self._merged = len(merged)
+
+    def text(self):
+        with self._cond: return "".join(delta.content for delta in self._deltas if delta.content)
+
+    def result(self):
+        # (text, model, usage) of everything pumped so far; model and usage are the last ones reported.
+        with self._cond:
+            model = next((delta.model for delta in reversed(self._deltas) if delta.model), None)
+            usage = next((delta.usage for delta in reversed(self._deltas) if delta.usage), None)
+        return self.text(), model, usage
+
+class Subscription:
+    # One reader of a flight. Late subscribers first receive everything buffered so far, then the live tail.
+    def __init__(self, flight):
+        self._flight = flight; self._index = 0; self._closed = False
+
+    def take(self, timeout=None):
+        # Returns (deltas, done) as soon as anything new is buffered, the flight ends or `timeout` seconds pass.
+        flight = self._flight
+        with flight._cond:
+            if self._index >= len(flight._deltas) and not flight._done: flight._cond.wait(timeout)
+        return self._take()
+
+    def _take(self):
+        flight = self._flight
+        with flight._cond:
+            pending, done = flight._deltas[self._index:], flight._done
+            self._index += len(pending)
+            if self._index - flight._merged >= COMPACT_EVERY: flight._compact()
+        # An upstream error is raised only once everything buffered before it has been handed out.
+        if pending: return pending, done and flight._error is None
+        if done and flight._error is not None: raise flight._error
+        return pending, done
+
+    def close(self):
+        if self._closed: return
+        self._closed = True
+        flight = self._flight
+        with flight._cond:
+            flight._subscriptions.discard(self)
+            # The pump only notices on its next chunk, which a stalled upstream may never send; on_abandon runs now.
+            abandoned = not flight._subscriptions and not flight._done and not flight._abandoned
+            if abandoned: flight._abandoned = True
+        if abandoned: flight._abandon()
+
+    def __iter__(self):
+        try:
+            while True:
+                pending, done = self.take()
+                yield from pending
+                if done: return
+        finally:
+            self.close()
+
+class AsyncFlight(Flight):
+    # Flight for the asyncio engine: the source is an async iterator pumped by a task on the running loop, and
+    # subscribers await their deltas. The buffer and its lock are Flight's; the lock is never held across an await.
+    def __init__(self, on_done, on_complete=None, on_abandon=None):
+        super().__init__(on_done, on_complete, on_abandon)
+        self._changed = asyncio.Event(); self._task = None
+
+    def _subscribe(self): return AsyncSubscription(self)
+
+    def start(self, source):
+        # The task runs in a copy of the owner's context, like Flight's pump thread.
+        self._task = asyncio.get_running_loop().create_task(self._pump(source))
+
+    def _wake(self):
+        self._changed.set(); self._changed = asyncio.Event()
+
+    async def _pump(self, source):
+        try:
+            async for chunk in source:
+                delta = Delta.from_chunk(chunk)
+                with self._cond:
+                    if not self._subscriptions:
+                        self._abandoned = True; break
+                    self._deltas.append(delta)
+                self._wake()
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            self._error = e
+        finally:
+            if hasattr(source, "aclose"): await source.aclose()
+            if self._on_complete is not None and self._error is None and not self._abandoned: self._on_complete(self)
+            with self._cond: self._done = True
+            self._wake()
+            self._on_done(self)
+
+    def _abandon(self):
+        # Unlike a thread, the task can stop at once, cancelling the upstream read it is waiting on.
+        if self._task is not None: self._task.cancel()
+        super()._abandon()
+
+class AsyncSubscription(Subscription):
+    async def take(self, timeout=None):
+        flight = self._flight
+        with flight._cond: changed, ready = flight._changed, self._index < len(flight._deltas) or flight._done
+        if not ready:
+            try: await asyncio.wait_for(changed.wait(), timeout)
+            except asyncio.TimeoutError: pass
+        return self._take()
+
+class SingleFlight:
+    flight_class = Flight
+
+    def __init__(self):
+        self._lock = threading.Lock(); self._flights = {}
+        self.started = self.coalesced = 0
+
+    def join(self, key, source_factory, on_complete=None, on_abandon=None):
+        # Returns (subscription, is_owner). source_factory is only called by the request that starts the flight, and
+        # on_complete(flight) runs once its source is exhausted without an error, before any subscriber sees the end.
+        # on_abandon(flight) runs when the last subscriber leaves before that; the flight can no longer be joined then.
+        def abandon(flight):
+            self._finish(key, flight)
+            if on_abandon is not None: on_abandon(flight)
+
+        with self._lock:
+            flight = self._flights.get(key)
+            subscription = flight.attach() if flight is not None else None
+            if subscription:
+                self.coalesced += 1
+                return subscription, False
+            flight = self._flights[key] = self.flight_class(lambda done: self._finish(key, done), on_complete, abandon)
+            subscription = flight.attach(); self.started += 1
+        flight.start(source_factory())
+        return subscription, True
+
+    def has(self, key):
+        with self._lock: return key in self._flights
+
+    def _finish(self, key, flight):
+        with self._lock:
+            if self._flights.get(key) is flight: del self._flights[key]
+
+    def stats(self):
+        with self._lock: return {"in_flight": len(self._flights), "started": self.started, "coalesced": self.coalesced}
+
+class AsyncSingleFlight(SingleFlight):
+    # join() must be called on the event loop; source_factory returns an async iterator of chunks.
+    flight_class = AsyncFlight
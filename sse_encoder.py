@@ -0,0 +1,69 @@
+# sse_encoder.py - Moreweb AI Runtime v0.1.0
+# Low-overhead chat.completion.chunk SSE encoding with optional delta coalescing and keep-alive heartbeats.
+
+import json
+import time
+from json.encoder import encode_basestring_ascii
+
+DONE = "data: [DONE]\n\n"
+HEARTBEAT = ": keep-alive\n\n"
+
+class SseEncoder:
+    # Everything except the delta text is fixed for a stream, so each event is prefix + escaped text + suffix.
+    def __init__(self, completion_id, created_time, model):
+        self.completion_id, self.created_time = completion_id, created_time
+        self._suffix = '},"finish_reason":null}]}\n\n'
+        self.model = None; self.set_model(model)
+
+    def set_model(self, model):
+        if model == self.model: return
+        self.model = model
+        self._head = f'data: {{"id":{encode_basestring_ascii(self.completion_id)},"object":"chat.completion.chunk","created":{self.created_time},"model":{encode_basestring_ascii(model)},"choices":[{{"index":0,"delta":{{'
+        self._prefix = self._head + '"content":'
+
+    def delta(self, content):
+        return self._prefix + encode_basestring_ascii(content) + self._suffix
+
+    def final(self, finish_reason="stop", usage=None):
+        usage_part = f',"usage":{json.dumps(usage, separators=(",", ":"))}' if usage else ""
+        return f'{self._head}}},"finish_reason":{encode_basestring_ascii(finish_reason)}}}]{usage_part}}}\n\n'
+
+class EventWriter:
+    # Buffers deltas until `window` seconds have passed since the first one or `max_bytes` are pending,
+    # and emits a comment heartbeat when nothing has been written for `heartbeat` seconds.
+    def __init__(self, encoder, window=0.0, max_bytes=1024, heartbeat=15.0, clock=time.monotonic):
+        self.encoder, self.window, self.max_bytes, self.heartbeat, self._clock = encoder, window, max_bytes, heartbeat, clock
+        self._pending = []; self._pending_bytes = 0; self._deadline = None; self._last_write = clock()
+
+    def timeout(self):
+        # How long the caller may block waiting for upstream before poll() has something to do.
+        now = self._clock()
+        timeout = self.heartbeat - (now - self._last_write) if self.heartbeat else None
+        if self._deadline is not None: timeout = self._deadline - now if timeout is None else min(timeout, self._deadline - now)
+        return None if timeout is None else max(timeout, 0.0)
+
+    def add(self, content):
+        self._pending.append(content); self._pending_bytes += len(content)
+        if self._deadline is None: self._deadline = self._clock() + self.window
+
+    def poll(self, done=False):
+        now = self._clock()
+        if self._pending and (done or self._pending_bytes >= self.max_bytes or now >= self._deadline):
+            event = self.encoder.delta("".join(self._pending))
+            self._pending = []; self._pending_bytes = 0; self._deadline = None; self._last_write = now
+            return event
+        if not self._pending and self.heartbeat and now - self._last_write >= self.heartbeat:
+            self._last_write = now
+            return HEARTBEAT
+        return ""
+
+    def switch_model(self, model):
+        # Deltas already buffered were produced by the previous model, so they are flushed under its name first.
+        if model == self.encoder.model: return ""
+        event = self.poll(done=True)
+        self.encoder.set_model(model)
+        return event
+
+def event_writer(settings, completion_id, created_time, model="g4f-stream"):
+    # Builds the writer for one stream from a RuntimeConfig snapshot.
+    return EventWriter(SseEncoder(completion_id, created_time, model), settings["stream_coalesce_ms"] / 1000, settings["stream_coalesce_bytes"], settings["stream_heartbeat_s"])
@@ -0,0 +1,261 @@
+# telemetry.py - Moreweb AI Runtime v0.1.0
+# Prometheus-style metrics, per-request trace IDs and the optional structured JSON log format.
+
+import atexit
+import contextvars
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 80.0, 160.0)
+RATE_BUCKETS = (1, 5, 10, 20, 40, 80, 160, 320)
+ATTEMPT_BUCKETS = (1, 2, 3, 4, 6, 8)
+TRACE_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,128}$")
+SHARE_INTERVAL = 1.0     # seconds between two publications of a worker's metrics to the shared store
+EXITED = "exited"        # shared row holding the summed counters and histograms of workers that have exited
+
+current_trace = contextvars.ContextVar("moreweb_trace", default=None)
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs: return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+def _format_number(value):
+    return "+Inf" if value == float("inf") else repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    kind = None
+    def __init__(self, name, help_text, labels=()):
+        self.name, self.help, self.labels = name, help_text, tuple(labels)
+        self._lock = threading.Lock(); self._values = {}
+
+    def header(self): return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def dump(self, values=None):
+        with self._lock: return [[list(labels), value] for labels, value in (self._values if values is None else values).items()]
+
+class Counter(_Metric):
+    kind = "counter"
+    def inc(self, *labels, amount=1):
+        with self._lock: self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        with self._lock: return self._values.get(labels, 0)
+
+    def set(self, *labels, value):
+        # For totals sampled from elsewhere, such as the process's CPU time.
+        with self._lock: self._values[labels] = value
+
+    def merge(self, values, dumped):
+        for labels, value in dumped: values[tuple(labels)] = values.get(tuple(labels), 0) + value
+
+    def render(self, values=None):
+        with self._lock: items = sorted((self._values if values is None else values).items())
+        return self.header() + [f"{self.name}{_format_labels(self.labels, labels)} {_format_number(value)}" for labels, value in items]
+
+class Gauge(Counter):
+    kind = "gauge"
+    def dec(self, *labels, amount=1): self.inc(*labels, amount=-amount)
+
+class Histogram(_Metric):
+    kind = "histogram"
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels); self.buckets = tuple(buckets) + (float("inf"),)
+
+    def observe(self, value, *labels):
+        with self._lock:
+            counts, total = self._values.get(labels, ([0] * len(self.buckets), 0.0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound: counts[index] += 1; break
+            self._values[labels] = (counts, total + value)
+
+    def dump(self, values=None):
+        with self._lock: return [[list(labels), [list(counts), total]] for labels, (counts, total) in (self._values if values is None else values).items()]
+
+    def merge(self, values, dumped):
+        for labels, (counts, total) in dumped:
+            mine = values.get(tuple(labels), ([0] * len(self.buckets), 0.0))
+            values[tuple(labels)] = ([a + b for a, b in zip(mine[0], counts)], mine[1] + total)
+
+    def render(self, values=None):
+        lines = self.header()
+        with self._lock: items = sorted((labels, (list(counts), total)) for labels, (counts, total) in (self._values if values is None else values).items())
+        for labels, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, labels, [('le', _format_number(bound))])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, labels)} {total!r}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, labels)} {cumulative}")
+        return lines
+
+REQUESTS = Counter("moreweb_requests_total", "Chat completion requests by mode, streaming flag and outcome.", ("mode", "stream", "outcome"))
+IN_FLIGHT = Gauge("moreweb_requests_in_flight", "Chat completion requests currently being served.")
+TTFT = Histogram("moreweb_time_to_first_token_seconds", "Time from request start to the first content delta.", ("model", "provider"))
+DURATION = Histogram("moreweb_request_duration_seconds", "Total time to serve a chat completion from upstream.", ("model", "provider"))
+TOKEN_RATE = Histogram("moreweb_stream_tokens_per_second", "Streamed content deltas per second after the first one.", ("model", "provider"), RATE_BUCKETS)
+ATTEMPTS = Histogram("moreweb_fallback_attempts", "Upstream models tried to serve one request.", (), ATTEMPT_BUCKETS)
+UPSTREAM = Counter("moreweb_upstream_attempts_total", "Upstream model attempts by outcome.", ("model", "outcome"))
+ERRORS = Counter("moreweb_errors_total", "Errors by type.", ("type",))
+PROCESS_CPU = Counter("process_cpu_seconds_total", "User and system CPU time spent by the server's processes.")
+PROCESS_RSS = Gauge("process_resident_memory_bytes", "Resident memory size of the server's processes.")
+METRICS = (REQUESTS, IN_FLIGHT, TTFT, DURATION, TOKEN_RATE, ATTEMPTS, UPSTREAM, ERRORS, PROCESS_CPU, PROCESS_RSS)
+_collectors = []
+
+def add_collector(collector):
+    # `collector()` returns extra (name, type, help, [(labels_dict, value)]) tuples read at scrape time, e.g. cache counters.
+    _collectors.append(collector)
+
+_shared = {}
+
+def share(path):
+    # Multi-worker mode: every worker publishes its METRICS to the SQLite file at `path`, and a scrape of any worker
+    # renders the sum over all of them. Collector metrics (cache, coalescing, admission) still describe the scraped worker.
+    db = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("CREATE TABLE IF NOT EXISTS worker_metrics (worker TEXT PRIMARY KEY, pid INTEGER, updated REAL NOT NULL, data TEXT NOT NULL)")
+    _shared.update(db=db, worker=uuid.uuid4().hex, lock=threading.Lock())
+    _publish()
+    threading.Thread(target=_publish_forever, daemon=True).start()
+    atexit.register(_retire)
+
+def _sample_process():
+    PROCESS_CPU.set(value=time.process_time())
+    rss = _resident_memory()
+    if rss is not None: PROCESS_RSS.set(value=rss)
+
+def _publish():
+    _sample_process()
+    data = json.dumps({metric.name: metric.dump() for metric in METRICS})
+    with _shared["lock"]:
+        _shared["db"].execute("INSERT OR REPLACE INTO worker_metrics (worker, pid, updated, data) VALUES (?, ?, ?, ?)", (_shared["worker"], os.getpid(), time.time(), data))
+
+def _retire():
+    # At exit a worker publishes its final counts and folds them into the EXITED row itself.
+    _publish(); _fold([_shared["worker"]])
+
+def _alive(pid):
+    if os.name != "posix": return True   # os.kill(pid, 0) would send CTRL_C_EVENT on Windows; rows there fold at exit only
+    try: os.kill(pid, 0)
+    except ProcessLookupError: return False
+    except PermissionError: pass
+    return True
+
+def _fold(workers=None):
+    # Adds the counters and histograms of exited workers to the EXITED row and deletes their rows, so the table holds
+    # one row per live worker plus one. `workers` names the rows to fold; by default, rows whose process is gone.
+    # Gauges are dropped: they only describe live workers. The write lock keeps two workers from folding a row twice.
+    db = _shared["db"]
+    with _shared["lock"]:
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            rows = db.execute("SELECT worker, pid, data FROM worker_metrics WHERE worker != ?", (EXITED,)).fetchall()
+            rows = [(worker, data) for worker, pid, data in rows if (worker in workers if workers is not None else not _alive(pid))]
+            if rows:
+                exited = db.execute("SELECT data FROM worker_metrics WHERE worker = ?", (EXITED,)).fetchone()
+                totals = {metric.name: {} for metric in METRICS if metric.kind != "gauge"}
+                for data in ([exited[0]] if exited else []) + [data for _, data in rows]:
+                    dumped = json.loads(data)
+                    for metric in METRICS:
+                        if metric.name in totals: metric.merge(totals[metric.name], dumped.get(metric.name, []))
+                data = json.dumps({metric.name: metric.dump(totals[metric.name]) for metric in METRICS if metric.name in totals})
+                db.execute("INSERT OR REPLACE INTO worker_metrics (worker, pid, updated, data) VALUES (?, NULL, ?, ?)", (EXITED, time.time(), data))
+                db.executemany("DELETE FROM worker_metrics WHERE worker = ?", [(worker,) for worker, _ in rows])
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK"); raise
+
+def _publish_forever():
+    while True:
+        time.sleep(SHARE_INTERVAL)
+        try: _publish()
+        except sqlite3.Error as e: logging.getLogger("moreweb").warning(f"Could not publish metrics: {e}")
+
+def _merged_values():
+    # Counters and histograms include workers that have exited (through the EXITED row), so totals never go backwards.
+    _publish(); _fold()
+    with _shared["lock"]: rows = _shared["db"].execute("SELECT data FROM worker_metrics").fetchall()
+    merged = {metric.name: {} for metric in METRICS}
+    for (data,) in rows:
+        dumped = json.loads(data)
+        for metric in METRICS: metric.merge(merged[metric.name], dumped.get(metric.name, []))
+    return merged
+
+def render():
+    lines = []
+    if _shared: merged = _merged_values()
+    else: merged = {}; _sample_process()
+    for metric in METRICS: lines.extend(metric.render(merged.get(metric.name)))
+    for collector in _collectors:
+        for name, kind, help_text, samples in collector():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            lines += [f"{name}{_format_labels(tuple(labels), tuple(labels.values()))} {_format_number(value)}" for labels, value in samples]
+    return "\n".join(lines) + "\n"
+
+def _resident_memory():
+    # Current RSS in bytes where /proc is available; None elsewhere.
+    try:
+        with open("/proc/self/statm") as f: return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError): return None
+
+def record_attempt(model, ok, ttft, error=None):
+    # Registered as a HealthBoard listener, so every upstream attempt is counted wherever it happens.
+    UPSTREAM.inc(model, "ok" if ok else "error")
+    if not ok: ERRORS.inc(f"upstream.{type(error).__name__ if error is not None else 'unknown'}")
+    trace = current_trace.get()
+    if trace is not None: trace.attempts += 1
+
+def new_trace_id(incoming=None):
+    return incoming if incoming and TRACE_ID_PATTERN.match(incoming) else uuid.uuid4().hex
+
+class RequestTrace:
+    def __init__(self, mode, stream, trace_id=None, provider=None):
+        self.trace_id = new_trace_id(trace_id)
+        self.mode, self.stream, self.provider = mode, "true" if stream else "false", provider or "auto"
+        self.started = time.monotonic(); self.first_token_at = None
+        self.attempts = 0; self.deltas = 0; self.finished = False
+        IN_FLIGHT.inc()
+        current_trace.set(self)
+
+    def delta(self):
+        if self.first_token_at is None: self.first_token_at = time.monotonic()
+        self.deltas += 1
+
+    def finish(self, outcome, model=None, error_type=None):
+        # Idempotent: streaming responses may reach both their normal end and a cleanup path.
+        if self.finished: return
+        self.finished = True; IN_FLIGHT.dec()
+        REQUESTS.inc(self.mode, self.stream, outcome)
+        if error_type: ERRORS.inc(error_type)
+        if outcome != "ok": return
+        now, labels = time.monotonic(), (model or "unknown", self.provider)
+        DURATION.observe(now - self.started, *labels)
+        if self.attempts: ATTEMPTS.observe(self.attempts)
+        if self.first_token_at is not None:
+            TTFT.observe(self.first_token_at - self.started, *labels)
+            if self.stream == "true" and self.deltas > 1 and now > self.first_token_at: TOKEN_RATE.observe((self.deltas - 1) / (now - self.first_token_at), *labels)
+
+class TraceFilter(logging.Filter):
+    def filter(self, record):
+        trace = current_trace.get()
+        record.trace_id = trace.trace_id if trace is not None else "-"
+        return True
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {"ts": round(record.created, 3), "level": record.levelname.lower(), "logger": record.name, "trace_id": getattr(record, "trace_id", "-"), "message": record.getMessage()}
+        if record.exc_info: entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+def configure_logging(json_logs=False, level=logging.INFO):
+    handler = logging.StreamHandler()
+    handler.addFilter(TraceFilter())
+    handler.setFormatter(JsonFormatter() if json_logs else logging.Formatter("%(asctime)s [%(trace_id)s] › %(message)s"))
+    logging.basicConfig(level=level, handlers=[handler], force=True)
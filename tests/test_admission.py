@@ -0,0 +1,100 @@
+import asyncio
+import threading
+import time
+import pytest
+from admission import Admission, Gate, Overloaded, PRIORITIES, parse_priority
+
+HIGH, NORMAL, LOW = (PRIORITIES.index(name) for name in PRIORITIES)
+
+def queue_up(gate, arrivals):
+    # Starts one waiter per (client, priority) in order and returns the list their grants are appended to.
+    granted, threads = [], []
+    for client, priority in arrivals:
+        def wait(client=client, priority=priority):
+            started = gate.acquire(client, priority, timeout=5)
+            granted.append(client); gate.release(started)
+        threads.append(threading.Thread(target=wait)); threads[-1].start()
+        while gate.stats()["waiting"] < len(threads): time.sleep(0.001)
+    return granted, threads
+
+def test_higher_priority_tiers_go_first():
+    gate = Gate("test", 1); started = gate.acquire()
+    granted, threads = queue_up(gate, [("low", LOW), ("normal", NORMAL), ("high", HIGH)])
+    gate.release(started)
+    for thread in threads: thread.join()
+    assert granted == ["high", "normal", "low"]
+
+def test_clients_take_turns_within_a_tier():
+    gate = Gate("test", 1); started = gate.acquire()
+    granted, threads = queue_up(gate, [("a", NORMAL), ("a", NORMAL), ("a", NORMAL), ("b", NORMAL), ("c", NORMAL)])
+    gate.release(started)
+    for thread in threads: thread.join()
+    assert granted == ["a", "b", "c", "a", "a"]
+
+def test_full_queue_is_rejected_with_retry_after():
+    gate = Gate("test", 1, max_waiting=0); gate.acquire()
+    with pytest.raises(Overloaded) as raised: gate.acquire(timeout=5)
+    assert raised.value.reason == "queue_full" and raised.value.retry_after >= 1
+    assert gate.stats()["rejected"] == 1
+
+def test_wait_timeout_is_rejected_and_withdrawn():
+    gate = Gate("test", 1); gate.acquire()
+    with pytest.raises(Overloaded) as raised: gate.acquire(timeout=0.01)
+    assert raised.value.reason == "queue_timeout"
+    assert gate.stats()["waiting"] == 0 and gate.stats()["timed_out"] == 1
+
+def test_retry_after_follows_the_average_hold_time():
+    gate = Gate("test", 1, max_waiting=0)
+    gate.release(gate.acquire() - 19.5)
+    gate.acquire()
+    with pytest.raises(Overloaded) as raised: gate.acquire()
+    assert raised.value.retry_after == 20
+
+def test_grant_that_races_a_timeout_is_kept():
+    # The waiter is granted between its wait timing out and withdrawing; it must keep the slot rather than leak it.
+    gate = Gate("test", 1); started = gate.acquire()
+    waiter = gate._enqueue("late", NORMAL, lambda: None)
+    gate.release(started)
+    assert waiter.granted and gate._withdraw(waiter) is False
+    assert gate.stats()["active"] == 1 and gate.stats()["waiting"] == 0
+
+def test_cancelled_async_waiter_gives_back_a_late_grant():
+    async def run():
+        gate = Gate("test", 1); started = gate.acquire()
+        waiter = asyncio.ensure_future(gate.acquire_async(timeout=5))
+        await asyncio.sleep(0.01)
+        gate.release(started); waiter.cancel()
+        with pytest.raises(asyncio.CancelledError): await waiter
+        return gate.stats()
+    stats = asyncio.run(run())
+    assert stats["active"] == 0 and stats["waiting"] == 0
+
+def test_raising_the_capacity_admits_waiters():
+    gate = Gate("test", 1); gate.acquire()
+    granted, threads = queue_up(gate, [("a", NORMAL)])
+    gate.configure(2)
+    for thread in threads: thread.join()
+    assert granted == ["a"]
+
+def settings(**values):
+    return {"max_active_requests": 4, "max_queued_requests": 8, "queue_timeout_s": 0.05, "model_concurrency": {}, **values}
+
+def test_manual_admission_waits_for_the_model_and_releases_both_slots():
+    admission = Admission(); admission.configure(settings(model_concurrency={"m": 1}))
+    first = admission.admit("a", NORMAL, manual_model="m")
+    with pytest.raises(Overloaded) as raised: admission.admit("b", NORMAL, manual_model="m")
+    assert raised.value.reason == "queue_timeout"
+    assert admission.requests.stats()["active"] == 1
+    first.release()
+    assert admission.requests.stats()["active"] == 0 and admission.model("m").stats()["active"] == 0
+
+def test_auto_admission_is_refused_when_every_model_is_busy():
+    admission = Admission(); admission.configure(settings(model_concurrency={"a": 1, "b": 1}))
+    held = [admission.model(name).acquire() for name in ("a", "b")]
+    with pytest.raises(Overloaded) as raised: admission.admit("c", NORMAL, auto_models=["a", "b"])
+    assert raised.value.reason == "models_busy" and admission.requests.stats()["active"] == 0
+    admission.model("b").release(held[1])
+    admission.admit("c", NORMAL, auto_models=["a", "b"]).release()
+
+def test_unknown_priorities_fall_back_to_normal():
+    assert parse_priority("HIGH") == HIGH and parse_priority("urgent") == NORMAL and parse_priority(None) == NORMAL
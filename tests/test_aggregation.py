@@ -0,0 +1,64 @@
+import pytest
+import aggregation
+from aggregation import Aggregator, UpstreamTimeout, estimate_tokens, estimate_usage
+from fake_upstream import FakeUpstream
+
+class Clock:
+    def __init__(self): self.now = 100.0
+    def __call__(self): return self.now
+
+def chunk(text=None, model="m", usage=None):
+    return FakeUpstream().chunk(model, text, usage)
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock(); monkeypatch.setattr(aggregation.time, "monotonic", clock)
+    return clock
+
+def test_chunks_fold_into_text_model_and_usage():
+    answer = Aggregator()
+    assert answer.add(chunk("Hello ", "a")) == "Hello "
+    assert answer.add(chunk("world", "b")) == "world"
+    assert answer.add(chunk(usage=FakeUpstream().usage([], 2))) is None
+    assert (answer.text(), answer.chars, answer.model, answer.finish_reason) == ("Hello world", 11, "m", "stop")
+    assert answer.usage == {"prompt_tokens": 0, "completion_tokens": 2, "total_tokens": 2}
+
+def test_answer_is_truncated_at_max_chars():
+    answer = Aggregator(max_chars=8)
+    assert answer.add_delta("abcde") == "abcde"
+    assert answer.add_delta("fghij") == "fgh"
+    assert answer.truncated and answer.finish_reason == "length"
+    assert answer.add_delta("more") is None and answer.text() == "abcdefgh"
+
+def test_delta_ending_exactly_at_the_limit_is_not_truncated():
+    answer = Aggregator(max_chars=4)
+    assert answer.add_delta("abcd") == "abcd" and not answer.truncated
+    assert answer.add_delta("e") is None and answer.truncated and answer.chars == 4
+
+def test_without_limits_nothing_is_cut_or_timed():
+    answer = Aggregator(max_chars=0, timeout=0)
+    answer.add_delta("x" * 10000)
+    assert not answer.truncated and answer.remaining() is None and answer.remaining(3.0) == 3.0
+    answer.check_deadline()
+
+def test_remaining_shortens_waits_to_the_deadline(clock):
+    answer = Aggregator(timeout=10)
+    assert answer.remaining() == 10 and answer.remaining(2.0) == 2.0
+    clock.now += 9
+    assert answer.remaining(2.0) == 1.0
+    answer.check_deadline()
+    clock.now += 5
+    assert answer.remaining() == 0.0
+    with pytest.raises(UpstreamTimeout): answer.check_deadline()
+
+def test_usage_is_estimated_when_the_provider_sends_none():
+    messages = [{"role": "system", "content": "Be brief."}, {"role": "user", "content": "Hi, there!"}, {"role": "user", "content": [{"type": "image_url"}]}]
+    answer = Aggregator(); answer.add_delta("Hello, world.")
+    assert answer.usage_or_estimate(messages) == {"prompt_tokens": 7, "completion_tokens": 4, "total_tokens": 11}
+    answer.add_delta(None, usage={"prompt_tokens": 1, "completion_tokens": 2, "total_tokens": 3})
+    assert answer.usage_or_estimate(messages)["total_tokens"] == 3
+
+def test_token_estimate_counts_words_and_punctuation():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("don't stop") == 4
+    assert estimate_usage([], "a b c") == {"prompt_tokens": 0, "completion_tokens": 3, "total_tokens": 3}
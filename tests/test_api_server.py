@@ -0,0 +1,116 @@
+import pytest
+
+pytest.importorskip("g4f")
+import api_server
+import fake_upstream
+from runtime_config import RuntimeConfig
+
+REMOTE = {"REMOTE_ADDR": "203.0.113.9"}
+
+@pytest.fixture
+def config():
+    fake_upstream.install("ttft=0,tps=0,tokens=5")
+    api_server.response_cache.clear()
+    return RuntimeConfig(mode="AUTO+")
+
+@pytest.fixture
+def client(config):
+    return api_server.create_app(config).test_client()
+
+def ask(client, content, **fields):
+    return client.post("/v1/chat/completions", json={"messages": [{"role": "user", "content": content}], **fields})
+
+def test_clearing_the_cache_needs_authorization(client):
+    assert ask(client, "cache me").status_code == 200
+    assert client.delete("/v1/cache", environ_base=REMOTE).status_code == 403
+    assert client.get("/v1/cache", environ_base=REMOTE).get_json()["entries"] == 1
+    assert client.delete("/v1/cache").get_json()["entries"] == 0
+
+def test_shutdown_needs_authorization(client):
+    assert client.post("/shutdown", environ_base=REMOTE).status_code == 403
+    assert client.post("/shutdown").status_code == 500
+
+@pytest.mark.parametrize("options", [{"workers": 0}, {"default_model_concurrency": 0}, {"model_concurrency": {"gpt-4o": 0}}, {"max_retries": -1}])
+def test_batch_options_are_range_checked(client, tmp_path, options):
+    input_file = tmp_path / "in.jsonl"; input_file.write_text('{"messages": [{"role": "user", "content": "hi"}]}\n')
+    response = client.post("/v1/batches", json={"input_file": str(input_file), "output_file": str(tmp_path / "out.jsonl"), **options})
+    assert response.status_code == 400
+
+def test_batch_status_needs_authorization(client, tmp_path):
+    input_file = tmp_path / "in.jsonl"; input_file.write_text('{"messages": [{"role": "user", "content": "hi"}]}\n')
+    batch = client.post("/v1/batches", json={"input_file": str(input_file), "output_file": str(tmp_path / "out.jsonl")}).get_json()
+    assert client.get(f"/v1/batches/{batch['id']}", environ_base=REMOTE).status_code == 403
+    assert client.get(f"/v1/batches/{batch['id']}").status_code == 200
+
+def test_raced_attempts_respect_the_model_caps(config, client):
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    config.update(model_concurrency={model: 1 for model in api_server.AUTO_PLUS_MODELS})
+    upstream = fake_upstream.FakeUpstream(ttft=0.2, tps=0, tokens=5)
+    lock, state = threading.Lock(), {"open": 0, "peak": 0}
+    stream = upstream.stream
+    def counted(model, messages):
+        with lock: state["open"] += 1; state["peak"] = max(state["peak"], state["open"])
+        try: yield from stream(model, messages)
+        finally:
+            with lock: state["open"] -= 1
+    upstream.stream = counted
+    api_server.Client = upstream.client_classes()[0]
+    with ThreadPoolExecutor(3) as pool: statuses = list(pool.map(lambda index: ask(client, f"race {index}", race=7).status_code, range(3)))
+    assert state["peak"] <= len(api_server.AUTO_PLUS_MODELS)
+    assert statuses.count(200) >= 1
+
+def test_manual_request_waiting_too_long_for_its_model_gets_429(config, client):
+    config.update(mode="Manual", model="gpt-4o", provider="Fake", model_concurrency={"gpt-4o": 1}, queue_timeout_s=0.05)
+    held = api_server.admission.model("gpt-4o").acquire()
+    try:
+        response = ask(client, "manual", stream=True)
+        assert response.status_code == 429 and int(response.headers["Retry-After"]) >= 1
+    finally:
+        api_server.admission.model("gpt-4o").release(held)
+    assert ask(client, "manual").status_code == 200
+
+def test_auto_request_with_every_model_busy_gets_429(config, client):
+    config.update(model_concurrency={model: 1 for model in api_server.AUTO_PLUS_MODELS})
+    held = [api_server.admission.model(model).acquire() for model in api_server.AUTO_PLUS_MODELS]
+    try:
+        response = ask(client, "busy")
+        assert response.status_code == 429 and "Retry-After" in response.headers
+    finally:
+        for model, started in zip(api_server.AUTO_PLUS_MODELS, held): api_server.admission.model(model).release(started)
+    assert ask(client, "busy").status_code == 200
+
+def test_model_filling_up_after_admission_gets_429(config, client, monkeypatch):
+    config.update(model_concurrency={model: 1 for model in api_server.AUTO_PLUS_MODELS})
+    monkeypatch.setattr(api_server.Admission, "_check_models", lambda self, models: None)
+    held = [api_server.admission.model(model).acquire() for model in api_server.AUTO_PLUS_MODELS]
+    try: assert ask(client, "late").status_code == 429
+    finally:
+        for model, started in zip(api_server.AUTO_PLUS_MODELS, held): api_server.admission.model(model).release(started)
+
+def test_timed_out_request_gives_its_slot_back_while_upstream_stalls(config, client):
+    config.update(max_active_requests=1, queue_timeout_s=0, upstream_timeout_s=0.2)
+    api_server.Client = fake_upstream.FakeUpstream(ttft=2, tps=0, tokens=5).client_classes()[0]
+    assert ask(client, "stalled").status_code == 504
+    assert api_server.admission.requests.stats()["active"] == 0
+    assert not api_server.in_flight.has(api_server.cache_key([{"role": "user", "content": "stalled"}], "AUTO+"))
+    api_server.Client = fake_upstream.FakeUpstream(ttft=0, tps=0, tokens=5).client_classes()[0]
+    assert ask(client, "next").status_code == 200
+
+class FailsOnceMidStream(fake_upstream.FakeUpstream):
+    # The first upstream call dies after two tokens; every later one succeeds.
+    def __init__(self, **settings):
+        super().__init__(**settings); self.failed = False
+
+    def plan(self, model):
+        tokens, fail_now, _ = super().plan(model)
+        fail_after, self.failed = (None if self.failed else 2), True
+        return tokens, fail_now, fail_after
+
+def test_batch_does_not_cache_a_continued_answer(config):
+    import batch_runner
+    api_server.Client = FailsOnceMidStream(ttft=0, tps=0, tokens=5).client_classes()[0]
+    body = {"messages": [{"role": "user", "content": "continued in a batch"}]}
+    job = batch_runner.BatchJob("unused.jsonl", "unused.out.jsonl", "AUTO+", log=lambda message: None)
+    assert job.complete(body)["choices"][0]["message"]["content"]
+    assert api_server.response_cache.get(api_server.cache_key(body["messages"], "AUTO+")) is None
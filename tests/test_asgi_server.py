@@ -0,0 +1,59 @@
+import asyncio
+import json
+import pytest
+
+pytest.importorskip("g4f")
+import api_server
+import asgi_server
+import fake_upstream
+from runtime_config import RuntimeConfig
+
+@pytest.fixture
+def config():
+    api_server.response_cache.clear()
+    return RuntimeConfig(mode="AUTO+")
+
+def counted_upstream(**settings):
+    # Installs a FakeUpstream for the ASGI engine and returns the list its upstream calls are recorded in.
+    upstream, calls = fake_upstream.FakeUpstream(tps=0, tokens=5, **settings), []
+    stream_async = upstream.stream_async
+    def recorded(model, messages):
+        calls.append(model); return stream_async(model, messages)
+    upstream.stream_async = recorded
+    asgi_server.AsyncClient = upstream.client_classes()[1]
+    return calls
+
+async def ask(app, content, **fields):
+    # Sends one chat completion through the ASGI app and returns (status, headers, body).
+    body = json.dumps({"messages": [{"role": "user", "content": content}], **fields}).encode()
+    scope = {"type": "http", "method": "POST", "path": "/v1/chat/completions", "headers": [(b"content-type", b"application/json")], "client": ("127.0.0.1", 5000)}
+    requests, connected, sent = [{"type": "http.request", "body": body}], asyncio.Event(), []
+    async def receive():
+        if requests: return requests.pop()
+        await connected.wait()
+    async def send(message): sent.append(message)
+    await app(scope, receive, send)
+    start = sent[0]
+    return start["status"], dict(start["headers"]), b"".join(message.get("body", b"") for message in sent[1:])
+
+def test_identical_requests_share_one_upstream_call(config):
+    config.update(max_active_requests=1, queue_timeout_s=0)
+    calls, app = counted_upstream(ttft=0.2), asgi_server.AsgiApp(config)
+    coalesced = api_server.in_flight_async.stats()["coalesced"]
+    async def run(): return await asyncio.gather(*(ask(app, "same question", stream=index % 2 == 0) for index in range(6)))
+    responses = asyncio.run(run())
+    assert [status for status, _, _ in responses] == [200] * 6
+    assert len(calls) == 1 and api_server.in_flight_async.stats()["coalesced"] - coalesced == 5
+    assert json.loads(responses[1][2])["choices"][0]["message"]["content"] == "tok0 tok1 tok2 tok3 tok4 "
+    assert b"tok4" in responses[0][2]
+    assert api_server.admission.requests.stats()["active"] == 0
+
+def test_timed_out_request_cancels_the_flight_and_gives_its_slot_back(config):
+    config.update(max_active_requests=1, queue_timeout_s=0, upstream_timeout_s=0.2)
+    counted_upstream(ttft=2)
+    app = asgi_server.AsgiApp(config)
+    assert asyncio.run(ask(app, "stalled"))[0] == 504
+    assert api_server.admission.requests.stats()["active"] == 0
+    counted_upstream(ttft=0)
+    status, headers, _ = asyncio.run(ask(app, "stalled"))
+    assert status == 200 and headers[b"x-cache"] == b"MISS"
@@ -0,0 +1,50 @@
+import asyncio
+from fake_upstream import FakeUpstream
+from continuation import CONTINUE_PROMPT, MIN_OVERLAP, OVERLAP_WINDOW, OverlapTrimmer, continuation_messages, overlap, trim_overlap, trim_overlap_async
+
+def chunks(*texts):
+    fake = FakeUpstream()
+    return [fake.chunk("next", text) for text in texts]
+
+def text(items):
+    return "".join(item.choices[0].delta.content or "" for item in items if item.choices)
+
+def test_continuation_messages_append_the_partial_answer_and_the_prompt():
+    messages = [{"role": "user", "content": "Tell a story."}]
+    assert continuation_messages(messages, "Once upon") == messages + [{"role": "assistant", "content": "Once upon"}, {"role": "user", "content": CONTINUE_PROMPT}]
+    assert len(messages) == 1
+
+def test_overlap_finds_the_longest_repeated_suffix():
+    assert overlap("The quick brown fox", "brown fox jumps") == len("brown fox")
+    assert overlap("The quick brown fox", " jumps over") == 0
+
+def test_short_matches_are_treated_as_coincidence():
+    assert overlap("ends with the", "the start") == 0
+    assert overlap("x" * MIN_OVERLAP, "x" * MIN_OVERLAP + " more") == MIN_OVERLAP
+
+def test_repeated_text_spanning_several_chunks_is_dropped():
+    partial = "The answer is forty-two, as everyone knows"
+    result = list(trim_overlap(chunks("as every", "one knows", ", and more", " follows."), partial))
+    assert text(result) == ", and more follows."
+
+def test_text_without_overlap_passes_through_unchanged():
+    partial = "First part."
+    assert text(trim_overlap(chunks(" Second", " part."), partial)) == " Second part."
+
+def test_chunks_are_held_until_the_window_fills_then_stream_through():
+    trimmer = OverlapTrimmer("the end of the partial answer")
+    assert trimmer.feed(chunks("x" * (OVERLAP_WINDOW - 1))[0]) == []
+    released = trimmer.feed(chunks("y")[0])
+    assert text(released) == "x" * (OVERLAP_WINDOW - 1) + "y"
+    assert text(trimmer.feed(chunks("z")[0])) == "z" and trimmer.flush() == []
+
+def test_chunks_without_content_are_kept():
+    usage_chunk = FakeUpstream().chunk("next", usage=object())
+    result = list(trim_overlap(chunks("repeated text") + [usage_chunk], "some repeated text"))
+    assert text(result) == "" and result[-1] is usage_chunk
+
+def test_async_trimming_matches_the_sync_version():
+    async def source():
+        for item in chunks("as every", "one knows", ", and more"): yield item
+    async def run(): return [item async for item in trim_overlap_async(source(), "as everyone knows")]
+    assert text(asyncio.run(run())) == ", and more"
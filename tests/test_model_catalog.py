@@ -0,0 +1,20 @@
+from model_catalog import ModelCatalog
+
+def catalog(tmp_path, providers):
+    return ModelCatalog(str(tmp_path / "catalog.json"), builder=lambda: providers)
+
+def test_models_list_every_provider_of_a_model(tmp_path):
+    models = catalog(tmp_path, {"B": ["gpt-4o"], "A": ["gpt-4o", "gemini"]}).models()
+    assert [(model["id"], model["owned_by"], model["providers"]) for model in models] == [("gemini", "A", ["A"]), ("gpt-4o", "A", ["A", "B"])]
+
+def test_etag_ignores_the_build_time(tmp_path):
+    first = catalog(tmp_path, {"A": ["gpt-4o", "gemini"], "B": ["gpt-4o"]})
+    first.models()
+    rebuilt = ModelCatalog(str(tmp_path / "other.json"), builder=lambda: {"B": ["gpt-4o"], "A": ["gemini", "gpt-4o"]})
+    rebuilt._set({**rebuilt._build(), "built": first._data["built"] + 3600})
+    assert rebuilt.etag == first.etag and rebuilt.models()[0]["created"] != first.models()[0]["created"]
+
+def test_etag_changes_with_the_catalog(tmp_path):
+    first, second = catalog(tmp_path, {"A": ["gpt-4o"]}), ModelCatalog(str(tmp_path / "other.json"), builder=lambda: {"A": ["gpt-4o"], "B": ["gpt-4o"]})
+    first.models(); second.models()
+    assert first.etag != second.etag
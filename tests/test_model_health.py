@@ -0,0 +1,97 @@
+import time
+from model_health import HealthBoard, BASE_COOLDOWN, FAILURE_THRESHOLD, PROBE_TIMEOUT
+
+class Clock:
+    def __init__(self): self.now = 1000.0
+    def __call__(self): return self.now
+
+def tripped_board():
+    clock = Clock(); board = HealthBoard(clock=clock)
+    board.record_success("b", 0.5); board.record_success("c", 1.0)
+    for _ in range(FAILURE_THRESHOLD): board.record_failure("a", 0.2)
+    return clock, board
+
+def test_healthy_models_are_ordered_by_score():
+    board = HealthBoard(clock=Clock())
+    board.record_success("slow", 4.0); board.record_success("fast", 0.5)
+    assert board.order(["slow", "fast", "new"]) == ["fast", "slow", "new"]
+
+def test_open_model_is_skipped_until_its_cooldown_ends():
+    clock, board = tripped_board()
+    assert board.snapshot()["a"]["state"] == "open"
+    assert board.order(["a", "b", "c"]) == ["b", "c"]
+    clock.now += BASE_COOLDOWN - 1
+    assert board.order(["a", "b", "c"]) == ["b", "c"]
+
+def test_half_open_probe_goes_first_and_closes_on_success():
+    clock, board = tripped_board()
+    clock.now += BASE_COOLDOWN
+    assert board.order(["a", "b", "c"]) == ["a", "b", "c"]
+    assert board.snapshot()["a"]["state"] == "half_open"
+    # Only one request probes at a time.
+    assert board.order(["a", "b", "c"]) == ["b", "c"]
+    board.record_success("a", 0.2)
+    assert board.snapshot()["a"]["state"] == "closed"
+    assert "a" in board.order(["a", "b", "c"])
+
+def test_failed_probe_reopens_with_a_longer_cooldown():
+    clock, board = tripped_board()
+    clock.now += BASE_COOLDOWN
+    assert board.order(["a", "b", "c"])[0] == "a"
+    board.record_failure("a", None)
+    assert board.snapshot()["a"]["state"] == "open"
+    clock.now += BASE_COOLDOWN
+    assert board.order(["a", "b", "c"]) == ["b", "c"]
+    clock.now += BASE_COOLDOWN
+    assert board.order(["a", "b", "c"]) == ["a", "b", "c"]
+
+def test_unreported_probe_is_released_after_the_probe_timeout():
+    clock, board = tripped_board()
+    clock.now += BASE_COOLDOWN
+    board.order(["a", "b"])
+    clock.now += PROBE_TIMEOUT
+    assert board.order(["a", "b"]) == ["a", "b"]
+
+def test_one_probe_per_request():
+    clock = Clock(); board = HealthBoard(clock=clock)
+    for model in ("a", "b"):
+        for _ in range(FAILURE_THRESHOLD): board.record_failure(model)
+    clock.now += BASE_COOLDOWN
+    assert board.order(["a", "b", "c"]) == ["a", "c"]
+    assert board.order(["a", "b", "c"]) == ["b", "c"]
+
+def test_everything_tripped_probes_the_soonest_model():
+    clock = Clock(); board = HealthBoard(clock=clock)
+    for _ in range(FAILURE_THRESHOLD): board.record_failure("a")
+    clock.now += 1
+    for _ in range(FAILURE_THRESHOLD): board.record_failure("b")
+    assert board.order(["b", "a"]) == ["a"]
+
+def test_shared_board_is_seen_by_another_process(tmp_path):
+    first, second = HealthBoard(), HealthBoard()
+    first.share(str(tmp_path / "state.sqlite")); second.share(str(tmp_path / "state.sqlite"))
+    for _ in range(FAILURE_THRESHOLD): first.record_failure("a", 1.0)
+    second.record_success("b", 0.5)
+    assert second.order(["a", "b"]) == ["b"]
+    assert first.snapshot()["b"]["ttft"] == 0.5
+
+def test_shared_board_writes_only_what_changed(tmp_path):
+    first, second = HealthBoard(), HealthBoard()
+    first.share(str(tmp_path / "state.sqlite")); second.share(str(tmp_path / "state.sqlite"))
+    first.record_success("a", 1.0); first.record_success("b", 2.0)
+    changes = first._db.total_changes
+    assert first.order(["a", "b"]) == ["a", "b"] and first.snapshot()["a"]["ttft"] == 1.0
+    assert first._db.total_changes == changes
+    second.record_success("b", 0.1)
+    first.record_success("a", 2.0)
+    assert first._db.total_changes == changes + 1
+    # The write re-reads its rows, so the other worker's update to "b" is not overwritten.
+    assert first.snapshot()["b"]["ttft"] == second.snapshot()["b"]["ttft"] < 2.0
+
+def test_shared_half_open_probe_is_claimed_once(tmp_path):
+    first, second = HealthBoard(), HealthBoard()
+    first.share(str(tmp_path / "state.sqlite")); second.share(str(tmp_path / "state.sqlite"))
+    for _ in range(FAILURE_THRESHOLD): first.record_failure("a", 1.0)
+    for board in (first, second): board._clock = lambda: time.time() + BASE_COOLDOWN
+    assert first.order(["a", "b"]) == ["a", "b"]
+    assert second.order(["a", "b"]) == ["b"]
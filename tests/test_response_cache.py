@@ -0,0 +1,49 @@
+import response_cache
+from response_cache import ResponseCache, cache_key
+
+class Clock:
+    def __init__(self): self.now = 1700000000.0
+    def __call__(self): return self.now
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResponseCache(max_entries=2)
+    cache.put("a", "A", "m"); cache.put("b", "B", "m")
+    assert cache.get("a")["content"] == "A"
+    cache.put("c", "C", "m")
+    assert cache.get("b") is None
+    assert [cache.get(key)["content"] for key in ("a", "c")] == ["A", "C"]
+    assert cache.stats()["entries"] == 2
+
+def test_entries_expire_after_the_ttl(monkeypatch):
+    clock = Clock(); monkeypatch.setattr(response_cache.time, "time", clock)
+    cache = ResponseCache(ttl=60)
+    cache.put("a", "A", "m", {"total_tokens": 3})
+    clock.now += 59
+    assert cache.get("a") == {"content": "A", "model": "m", "usage": {"total_tokens": 3}, "created": 1700000000.0}
+    clock.now += 2
+    assert cache.get("a") is None
+    assert (cache.stats()["hits"], cache.stats()["misses"], cache.stats()["entries"]) == (1, 1, 0)
+
+def test_cache_key_ignores_key_order_but_not_content():
+    messages = [{"role": "user", "content": "hi"}]
+    assert cache_key(messages, "AUTO+") == cache_key([{"content": "hi", "role": "user"}], "AUTO+")
+    assert cache_key(messages, "AUTO+") != cache_key(messages, "Auto")
+    assert cache_key(messages, "Manual", "gpt-4o", "A") != cache_key(messages, "Manual", "gpt-4o", "B")
+    assert cache_key(messages, "AUTO+") != cache_key([{"role": "user", "content": "hi "}], "AUTO+")
+
+def test_entries_survive_a_reopened_store(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    first = ResponseCache(); first.open_store(path)
+    first.put("a", "A", "m", {"total_tokens": 3})
+    second = ResponseCache(path=path)
+    assert second.stats()["entries"] == 0
+    assert second.get("a")["content"] == "A" and second.stats()["entries"] == 1
+    second.clear()
+    assert ResponseCache(path=path).get("a") is None
+
+def test_expired_rows_in_the_store_are_not_served(tmp_path, monkeypatch):
+    clock = Clock(); monkeypatch.setattr(response_cache.time, "time", clock)
+    path = str(tmp_path / "cache.sqlite")
+    ResponseCache(ttl=60, path=path).put("a", "A", "m")
+    clock.now += 61
+    assert ResponseCache(ttl=60, path=path).get("a") is None
@@ -0,0 +1,45 @@
+import pytest
+from runtime_config import RuntimeConfig
+
+@pytest.mark.parametrize("changes", [
+    {"colour": "blue"}, {"mode": "Fast"}, {"model": 4}, {"admin_token": 1234}, {"admin_token": ["secret"]},
+    {"queue_timeout_s": -1}, {"max_active_requests": True}, {"stream_coalesce_ms": "10"},
+    {"model_concurrency": {"gpt-4o": 0}}, {"model_concurrency": {"gpt-4o": 1.5}}, {"model_concurrency": ["gpt-4o"]},
+])
+def test_invalid_settings_are_rejected_and_leave_the_config_unchanged(changes):
+    config = RuntimeConfig(admin_token="secret")
+    before = config.snapshot()
+    with pytest.raises(ValueError): config.update(**changes)
+    assert config.snapshot() is before
+
+def test_valid_update_replaces_the_snapshot_and_notifies_listeners():
+    config, seen = RuntimeConfig(), []
+    config.add_change_listener(seen.append)
+    before = config.snapshot()
+    config.update(mode="Auto", max_active_requests=8, upstream_timeout_s=2.5, model_concurrency={"gpt-4o": 2})
+    assert before["mode"] == "AUTO+" and config.snapshot()["mode"] == "Auto"
+    assert seen and seen[-1]["model_concurrency"] == {"gpt-4o": 2}
+
+def test_admin_token_is_never_published():
+    config, seen = RuntimeConfig(admin_token="secret"), []
+    config.add_change_listener(seen.append)
+    config.update(mode="Auto")
+    assert "admin_token" not in config.public_snapshot() and "admin_token" not in seen[-1]
+
+def test_admin_token_must_be_presented_as_a_bearer_token():
+    config = RuntimeConfig(admin_token="secret")
+    assert config.authorize("203.0.113.9", "Bearer secret")
+    for authorization in (None, "", "secret", "Bearer secre", "Bearer secret2", "bearer secret", "Basic secret"):
+        assert not config.authorize("203.0.113.9", authorization)
+    # With a token set, being on loopback is not enough.
+    assert not config.authorize("127.0.0.1", None)
+
+@pytest.mark.parametrize("remote_addr, allowed", [("127.0.0.1", True), ("127.8.9.10", True), ("::1", True), ("203.0.113.9", False), ("10.0.0.1", False), ("", False), (None, False), ("localhost", False)])
+def test_without_a_token_only_loopback_clients_may_administer(remote_addr, allowed):
+    for token in (None, ""):
+        assert RuntimeConfig(admin_token=token).authorize(remote_addr, "Bearer anything") is allowed
+
+def test_clearing_the_token_falls_back_to_loopback_only():
+    config = RuntimeConfig(admin_token="secret")
+    config.update(admin_token=None)
+    assert config.authorize("127.0.0.1", None) and not config.authorize("203.0.113.9", "Bearer secret")
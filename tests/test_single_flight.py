@@ -0,0 +1,163 @@
+import gc
+import threading
+import weakref
+import pytest
+from fake_upstream import FakeUpstream
+from single_flight import SingleFlight, COMPACT_EVERY
+
+def chunk(text, model="m"):
+    return FakeUpstream().chunk(model, text)
+
+class Source:
+    # A generator that hands out one item per release() call, so a test controls exactly what the flight has buffered.
+    def __init__(self, items, error=None):
+        self.items, self.error = [chunk(item) for item in items], error
+        self.gate = threading.Semaphore(0); self.closed = threading.Event()
+
+    def release(self, count=1):
+        for _ in range(count): self.gate.release()
+
+    def __iter__(self):
+        try:
+            for item in self.items:
+                self.gate.acquire(); yield item
+            self.gate.acquire()
+            if self.error: raise self.error
+        finally:
+            self.closed.set()
+
+def contents(deltas):
+    return [delta.content for delta in deltas]
+
+def collect(subscription):
+    items = []
+    while True:
+        pending, done = subscription.take(5)
+        items += contents(pending)
+        if done: return items
+
+def test_identical_requests_share_one_source():
+    flights, source, calls = SingleFlight(), Source(["a", "b", "c"]), []
+    def factory():
+        calls.append(1); return iter(source)
+    owner, is_owner = flights.join("key", factory)
+    joiner, joined_owner = flights.join("key", factory)
+    assert (is_owner, joined_owner, len(calls)) == (True, False, 1)
+    source.release(4)
+    assert collect(owner) == collect(joiner) == ["a", "b", "c"]
+    assert flights.stats()["coalesced"] == 1
+
+def test_late_joiner_replays_the_buffered_prefix():
+    flights, source = SingleFlight(), Source(["a", "b", "c"])
+    owner, _ = flights.join("key", lambda: iter(source))
+    source.release(2)
+    seen = []
+    while len(seen) < 2: seen += contents(owner.take(5)[0])
+    assert seen == ["a", "b"]
+    late, is_owner = flights.join("key", lambda: iter(source))
+    assert not is_owner
+    source.release(2)
+    assert collect(late) == ["a", "b", "c"]
+
+def test_take_times_out_without_new_items():
+    flights, source = SingleFlight(), Source(["a"])
+    subscription, _ = flights.join("key", lambda: iter(source))
+    assert subscription.take(0.05) == ([], False)
+    source.release(2)
+
+def test_error_is_raised_after_the_buffered_items():
+    flights, source = SingleFlight(), Source(["a", "b"], error=RuntimeError("upstream died"))
+    subscription, _ = flights.join("key", lambda: iter(source))
+    source.release(3)
+    items = []
+    with pytest.raises(RuntimeError, match="upstream died"):
+        while True: items += contents(subscription.take(5)[0])
+    assert items == ["a", "b"]
+
+def test_abandoned_flight_closes_its_source_and_cannot_be_joined():
+    flights, source = SingleFlight(), Source(["a", "b", "c"])
+    subscription, _ = flights.join("key", lambda: iter(source))
+    source.release()
+    assert contents(subscription.take(5)[0]) == ["a"]
+    subscription.close()
+    source.release()
+    assert source.closed.wait(5)
+    with pytest.raises(StopIteration): next(iter(subscription))
+    _, is_owner = flights.join("key", lambda: iter(Source([])))
+    assert is_owner
+
+def test_on_abandon_runs_when_the_last_subscriber_leaves_a_stalled_flight():
+    flights, source, abandoned = SingleFlight(), Source(["a"]), []
+    owner, _ = flights.join("key", lambda: iter(source), on_abandon=abandoned.append)
+    joiner, _ = flights.join("key", lambda: iter(source))
+    owner.close()
+    assert abandoned == []
+    joiner.close()
+    assert len(abandoned) == 1 and not flights.has("key")
+    source.release(2)
+    assert source.closed.wait(5) and len(abandoned) == 1
+
+def test_finished_flight_is_forgotten():
+    flights, source = SingleFlight(), Source(["a"])
+    subscription, _ = flights.join("key", lambda: iter(source))
+    source.release(2)
+    assert contents(subscription) == ["a"]
+    assert flights.stats()["started"] == 1
+
+def test_chunk_objects_are_not_retained():
+    flights = SingleFlight()
+    chunks = [chunk(f"tok{index} ") for index in range(COMPACT_EVERY * 3)]
+    references = [weakref.ref(item) for item in chunks]
+    source = iter(chunks); del chunks
+    subscription, _ = flights.join("key", lambda source=source: source)
+    assert "".join(collect(subscription)) == "".join(f"tok{index} " for index in range(COMPACT_EVERY * 3))
+    del source; gc.collect()
+    assert not any(reference() is not None for reference in references)
+
+def test_read_prefix_is_merged_and_still_replayed_to_late_joiners():
+    flights, source = SingleFlight(), Source([f"{index} " for index in range(COMPACT_EVERY * 2)] + ["end"])
+    completed = []
+    owner, _ = flights.join("key", lambda: iter(source), completed.append)
+    source.release(COMPACT_EVERY * 2)
+    read = []
+    while len(read) < COMPACT_EVERY * 2: read += contents(owner.take(5)[0])
+    source.release()
+    while "end" not in read: read += contents(owner.take(5)[0])
+    late, _ = flights.join("key", lambda: iter(source))
+    flight = late._flight
+    assert len(flight._deltas) < COMPACT_EVERY
+    source.release()
+    assert "".join(collect(late)) == "".join(read)
+    assert completed == [flight] and flight.result()[0] == "".join(read)
+
+def test_async_flight_is_shared_and_cancelled_when_abandoned():
+    import asyncio
+    from single_flight import AsyncSingleFlight
+    cancelled, calls = [], []
+    async def source(items, stall=False):
+        calls.append(1)
+        try:
+            for item in items:
+                await asyncio.sleep(0.01); yield chunk(item)
+            if stall: await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            cancelled.append(1); raise
+    async def collect_async(subscription):
+        items = []
+        while True:
+            pending, done = await subscription.take(5)
+            items += contents(pending)
+            if done: return items
+    async def run():
+        flights, abandoned = AsyncSingleFlight(), []
+        owner, _ = flights.join("key", lambda: source(["a", "b"]))
+        joiner, is_owner = flights.join("key", lambda: source(["x"]))
+        assert not is_owner
+        assert await collect_async(owner) == await collect_async(joiner) == ["a", "b"]
+        stalled, _ = flights.join("stalled", lambda: source(["a"], stall=True), on_abandon=abandoned.append)
+        assert contents((await stalled.take(5))[0]) == ["a"]
+        assert await stalled.take(0.05) == ([], False)
+        stalled.close(); await asyncio.sleep(0.05)
+        return len(abandoned), flights.has("stalled")
+    assert asyncio.run(run()) == (1, False)
+    assert len(calls) == 2 and cancelled == [1]
@@ -0,0 +1,62 @@
+import json
+from sse_encoder import SseEncoder, EventWriter, HEARTBEAT
+
+class Clock:
+    def __init__(self): self.now = 100.0
+    def __call__(self): return self.now
+
+def parse(event):
+    assert event.startswith("data: ") and event.endswith("\n\n")
+    return json.loads(event[6:])
+
+def writer(window=0.0, max_bytes=1024, heartbeat=15.0):
+    clock = Clock()
+    return clock, EventWriter(SseEncoder("chatcmpl-1", 1700000000, "m"), window, max_bytes, heartbeat, clock=clock)
+
+def test_events_match_the_json_encoding():
+    encoder = SseEncoder("chatcmpl-1", 1700000000, "gpt-4o")
+    chunk = parse(encoder.delta('quote " newline \n café'))
+    assert chunk == {"id": "chatcmpl-1", "object": "chat.completion.chunk", "created": 1700000000, "model": "gpt-4o",
+                     "choices": [{"index": 0, "delta": {"content": 'quote " newline \n café'}, "finish_reason": None}]}
+    final = parse(encoder.final("length", {"prompt_tokens": 1, "completion_tokens": 2, "total_tokens": 3}))
+    assert final["choices"] == [{"index": 0, "delta": {}, "finish_reason": "length"}] and final["usage"]["total_tokens"] == 3
+
+def test_without_a_window_every_delta_is_sent_at_once():
+    clock, events = writer()
+    events.add("a")
+    assert parse(events.poll())["choices"][0]["delta"]["content"] == "a"
+
+def test_deltas_within_the_window_are_merged():
+    clock, events = writer(window=0.05)
+    events.add("a"); assert events.poll() == ""
+    clock.now += 0.01; events.add("b"); assert events.poll() == ""
+    assert abs(events.timeout() - 0.04) < 1e-9
+    clock.now += 0.04
+    assert parse(events.poll())["choices"][0]["delta"]["content"] == "ab"
+
+def test_byte_limit_and_end_of_stream_flush_early():
+    clock, events = writer(window=10.0, max_bytes=4)
+    events.add("ab"); assert events.poll() == ""
+    events.add("cd"); assert parse(events.poll())["choices"][0]["delta"]["content"] == "abcd"
+    events.add("e"); assert parse(events.poll(done=True))["choices"][0]["delta"]["content"] == "e"
+
+def test_heartbeat_after_an_idle_period():
+    clock, events = writer(heartbeat=15.0)
+    clock.now += 14.0; assert events.poll() == "" and events.timeout() == 1.0
+    clock.now += 1.0; assert events.poll() == HEARTBEAT
+    clock.now += 1.0; assert events.poll() == ""
+    clock.now += 14.0; assert events.poll() == HEARTBEAT
+
+def test_heartbeats_can_be_disabled():
+    clock, events = writer(heartbeat=0)
+    clock.now += 1000.0
+    assert events.poll() == "" and events.timeout() is None
+
+def test_switching_models_flushes_under_the_old_name():
+    clock, events = writer(window=10.0)
+    events.add("old")
+    flushed = parse(events.switch_model("next"))
+    assert flushed["model"] == "m" and flushed["choices"][0]["delta"]["content"] == "old"
+    events.add("new")
+    assert parse(events.poll(done=True))["model"] == "next"
+    assert events.switch_model("next") == ""
@@ -0,0 +1,55 @@
+import json
+import pytest
+import telemetry
+
+@pytest.fixture
+def shared(tmp_path, monkeypatch):
+    # A shared store with this process as one worker; other workers are simulated by inserting their rows.
+    monkeypatch.setattr(telemetry, "_shared", {})
+    monkeypatch.setattr(telemetry.threading, "Thread", lambda **kwargs: type("Idle", (), {"start": lambda self: None})())
+    monkeypatch.setattr(telemetry.atexit, "register", lambda function: None)
+    for metric in telemetry.METRICS: monkeypatch.setattr(metric, "_values", {})
+    telemetry.share(str(tmp_path / "state.sqlite"))
+    yield telemetry._shared["db"]
+    telemetry._shared["db"].close()
+
+def add_worker(db, worker, pid, cpu, rss, errors):
+    data = {"process_cpu_seconds_total": [[[], cpu]], "process_resident_memory_bytes": [[[], rss]], "moreweb_errors_total": [[["timeout"], errors]]}
+    db.execute("INSERT INTO worker_metrics (worker, pid, updated, data) VALUES (?, ?, 0, ?)", (worker, pid, json.dumps(data)))
+
+def sample(name, labels=""):
+    line = next(line for line in telemetry.render().splitlines() if line.startswith(f"{name}{labels} "))
+    return float(line.split()[1])
+
+def test_process_metrics_are_summed_across_workers(shared, monkeypatch):
+    monkeypatch.setattr(telemetry.time, "process_time", lambda: 1.5)
+    monkeypatch.setattr(telemetry, "_resident_memory", lambda: 1000)
+    monkeypatch.setattr(telemetry, "_alive", lambda pid: True)
+    add_worker(shared, "other", 1, 2.0, 500, 3)
+    assert sample("process_cpu_seconds_total") == 3.5
+    assert sample("process_resident_memory_bytes") == 1500
+
+def test_exited_workers_are_folded_into_one_row(shared, monkeypatch):
+    monkeypatch.setattr(telemetry.time, "process_time", lambda: 1.0)
+    monkeypatch.setattr(telemetry, "_resident_memory", lambda: 1000)
+    monkeypatch.setattr(telemetry, "_alive", lambda pid: pid != 2)
+    add_worker(shared, "dead-1", 2, 2.0, 500, 3); add_worker(shared, "dead-2", 2, 4.0, 500, 1)
+    add_worker(shared, "live", 3, 8.0, 700, 2)
+    assert sample("process_cpu_seconds_total") == 15.0
+    assert sample("process_resident_memory_bytes") == 1700   # the exited workers' memory no longer counts
+    assert sample("moreweb_errors_total", '{type="timeout"}') == 6
+    rows = {worker for (worker,) in shared.execute("SELECT worker FROM worker_metrics")}
+    assert rows == {telemetry._shared["worker"], "live", telemetry.EXITED}
+    # A second fold adds to the aggregate row instead of replacing it.
+    monkeypatch.setattr(telemetry, "_alive", lambda pid: pid not in (2, 3))
+    telemetry._fold()
+    assert sample("process_cpu_seconds_total") == 15.0 and sample("moreweb_errors_total", '{type="timeout"}') == 6
+    assert {worker for (worker,) in shared.execute("SELECT worker FROM worker_metrics")} == {telemetry._shared["worker"], telemetry.EXITED}
+
+def test_a_retiring_worker_folds_its_own_row(shared, monkeypatch):
+    monkeypatch.setattr(telemetry.time, "process_time", lambda: 2.5)
+    telemetry._retire()
+    assert [worker for (worker,) in shared.execute("SELECT worker FROM worker_metrics")] == [telemetry.EXITED]
+    (data,) = shared.execute("SELECT data FROM worker_metrics").fetchone()
+    assert json.loads(data)["process_cpu_seconds_total"] == [[[], 2.5]]
+    assert "process_resident_memory_bytes" not in json.loads(data)
@@ -0,0 +1,125 @@
+import asyncio
+import threading
+from fake_upstream import FakeUpstream
+from model_health import HealthBoard, BASE_COOLDOWN, FAILURE_THRESHOLD
+from upstream_race import race_streams, race_streams_async
+
+def drain(generator):
+    chunks = []
+    while True:
+        try: chunks.append(next(generator))
+        except StopIteration as stop: return chunks, stop.value
+
+def text(chunks):
+    return "".join(chunk.choices[0].delta.content for chunk in chunks if chunk.choices and chunk.choices[0].delta.content)
+
+class Upstreams:
+    # One FakeUpstream per model, recording which streams were opened and which were closed before finishing.
+    def __init__(self, **per_model):
+        self.fakes = {model: FakeUpstream(tps=0, tokens=5, **settings) for model, settings in per_model.items()}
+        self.opened, self.closed = [], set(); self.lock = threading.Lock()
+
+    def open_stream(self, model):
+        with self.lock: self.opened.append(model)
+        def stream():
+            try: yield from self.fakes[model].stream(model, [])
+            except GeneratorExit:
+                self.closed.add(model); raise
+        return stream()
+
+def test_fastest_model_wins_and_the_loser_is_cancelled():
+    upstreams, health = Upstreams(slow={"ttft": 0.3}, fast={"ttft": 0.01}), HealthBoard()
+    chunks, (succeeded, untried, committed) = drain(race_streams(["slow", "fast"], upstreams.open_stream, health, lambda message: None))
+    assert (succeeded, untried, committed) == (True, [], True)
+    assert {chunk.model for chunk in chunks} == {"fast"}
+    assert text(chunks) == "tok0 tok1 tok2 tok3 tok4 "
+    assert health.snapshot()["fast"]["success_rate"] == 1.0 and "slow" not in health.snapshot()
+    threading.Event().wait(0.5)
+    assert "slow" in upstreams.closed
+
+def test_hedge_delay_holds_back_the_next_contender():
+    upstreams = Upstreams(first={"ttft": 0.01}, second={"ttft": 0.01})
+    chunks, (succeeded, untried, _) = drain(race_streams(["first", "second"], upstreams.open_stream, HealthBoard(), lambda message: None, hedge_delay=1.0))
+    assert succeeded and untried == ["second"] and upstreams.opened == ["first"]
+
+def test_failed_contender_is_replaced_immediately():
+    upstreams, health = Upstreams(broken={"ttft": 0.01, "failure_rate": 1.0}, spare={"ttft": 0.01}, unused={}), HealthBoard()
+    chunks, (succeeded, untried, committed) = drain(race_streams(["broken", "spare", "unused"], upstreams.open_stream, health, lambda message: None, hedge_delay=10.0))
+    assert succeeded and committed and untried == ["unused"]
+    assert {chunk.model for chunk in chunks} == {"spare"}
+    assert health.snapshot()["broken"]["consecutive_failures"] == 1
+
+def test_all_contenders_failing_reports_nothing_committed():
+    upstreams = Upstreams(a={"ttft": 0.01, "failure_rate": 1.0}, b={"ttft": 0.01, "failure_rate": 1.0})
+    chunks, result = drain(race_streams(["a", "b"], upstreams.open_stream, HealthBoard(), lambda message: None))
+    assert chunks == [] and result == (False, [], False)
+
+def test_winner_failing_mid_stream_is_committed():
+    upstreams = Upstreams(a={"ttft": 0.01, "midstream_failure_rate": 1.0}, b={"ttft": 0.5})
+    chunks, (succeeded, untried, committed) = drain(race_streams(["a", "b"], upstreams.open_stream, HealthBoard(), lambda message: None, hedge_delay=5.0))
+    assert not succeeded and committed and untried == ["b"] and text(chunks)
+
+def test_async_race_has_the_same_outcome():
+    fakes = {"slow": FakeUpstream(ttft=0.3, tps=0, tokens=3), "fast": FakeUpstream(ttft=0.01, tps=0, tokens=3)}
+    async def open_stream(model): return fakes[model].stream_async(model, [])
+    async def run():
+        result = {}
+        chunks = [chunk async for chunk in race_streams_async(["slow", "fast"], open_stream, HealthBoard(), lambda message: None, result=result)]
+        return chunks, result
+    chunks, result = asyncio.run(run())
+    assert text(chunks) == "tok0 tok1 tok2 " and {chunk.model for chunk in chunks} == {"fast"}
+    assert result == {"succeeded": True, "untried": [], "committed": True}
+
+def test_contender_at_its_cap_is_skipped_without_a_health_penalty():
+    from admission import Gate
+    upstreams, health, busy = Upstreams(capped={"ttft": 0.01}, free={"ttft": 0.05}), HealthBoard(), Gate("model 'capped'", 1)
+    busy.acquire()
+    def open_stream(model):
+        def stream():
+            gate = busy if model == "capped" else Gate(model)
+            with gate.hold(timeout=0): yield from upstreams.open_stream(model)
+        return stream()
+    chunks, (succeeded, untried, committed) = drain(race_streams(["capped", "free"], open_stream, health, lambda message: None))
+    assert succeeded and {chunk.model for chunk in chunks} == {"free"}
+    assert "capped" not in health.snapshot() and untried == ["capped"]
+
+class Clock:
+    def __init__(self): self.now = 1000.0
+    def __call__(self): return self.now
+
+def recovering_board(clock):
+    # A board whose model "a" has served its cooldown and whose half-open probe the first order() claims.
+    health = HealthBoard(clock=clock)
+    for _ in range(FAILURE_THRESHOLD): health.record_failure("a", 0.2)
+    clock.now += BASE_COOLDOWN
+    assert health.order(["a", "b", "c"]) == ["a", "b", "c"]
+    return health
+
+def test_probe_that_loses_the_race_is_released():
+    clock = Clock(); health = recovering_board(clock)
+    upstreams = Upstreams(a={"ttft": 0.3}, b={"ttft": 0.01})
+    chunks, (succeeded, _, _) = drain(race_streams(["a", "b"], upstreams.open_stream, health, lambda message: None))
+    assert succeeded and {chunk.model for chunk in chunks} == {"b"}
+    clock.now += 60
+    assert health.order(["a", "b", "c"]) == ["a", "b", "c"]
+    assert health.snapshot()["a"]["state"] == "half_open"
+
+def test_async_probe_that_loses_the_race_is_released():
+    health = recovering_board(Clock())
+    fakes = {"a": FakeUpstream(ttft=0.3, tps=0, tokens=3), "b": FakeUpstream(ttft=0.01, tps=0, tokens=3)}
+    async def open_stream(model): return fakes[model].stream_async(model, [])
+    async def run(): return [chunk async for chunk in race_streams_async(["a", "b"], open_stream, health, lambda message: None)]
+    assert {chunk.model for chunk in asyncio.run(run())} == {"b"}
+    assert health.order(["a", "b", "c"]) == ["a", "b", "c"]
+
+def test_probe_at_its_concurrency_cap_is_released():
+    from admission import Gate
+    health, busy = recovering_board(Clock()), Gate("model 'a'", 1)
+    busy.acquire()
+    upstreams = Upstreams(a={"ttft": 0.01}, b={"ttft": 0.05})
+    def open_stream(model):
+        def stream():
+            with (busy if model == "a" else Gate(model)).hold(timeout=0): yield from upstreams.open_stream(model)
+        return stream()
+    drain(race_streams(["a", "b"], open_stream, health, lambda message: None))
+    assert health.order(["a", "b", "c"]) == ["a", "b", "c"]
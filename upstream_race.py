@@ -0,0 +1,154 @@
+# upstream_race.py - Moreweb AI Runtime v0.1.0
+# Hedged upstream requests: start several models and commit to the first one that produces a token.
+
+import asyncio
+import queue
+import threading
+import time
+from admission import Overloaded
+
+DEFAULT_RACE_WIDTH = 2
+
+def has_content(chunk): return bool(chunk.choices and chunk.choices[0].delta.content)
+
+class _Contender(threading.Thread):
+    def __init__(self, model, open_stream, events):
+        super().__init__(daemon=True)
+        self.model, self.open_stream, self.events = model, open_stream, events
+        self.cancelled = threading.Event(); self.finished = False; self.ttft = None
+
+    def run(self):
+        started, stream = time.monotonic(), None
+        try:
+            stream = self.open_stream(self.model)
+            for chunk in stream:
+                if self.cancelled.is_set(): break
+                if self.ttft is None and has_content(chunk): self.ttft = time.monotonic() - started
+                self.events.put((self, "chunk", chunk))
+            else:
+                self.events.put((self, "done", None))
+        except Exception as e:
+            self.events.put((self, "error", e))
+        finally:
+            # A cancelled loser stops pulling tokens; closing the generator releases its upstream connection.
+            if self.cancelled.is_set() and hasattr(stream, "close"): stream.close()
+
+def race_streams(models, open_stream, health, log, hedge_delay=0.0):
+    # Yields the chunks of the first model to produce content and returns (succeeded, untried_models, committed).
+    # A new contender is launched every `hedge_delay` seconds, or immediately when all running ones have failed.
+    # A stream that raises Overloaded (its model is at its concurrency cap) is skipped without a health penalty
+    # and its model is returned among the untried ones. Contenders that end without an outcome give back their probe.
+    events, pending, running, buffered, skipped = queue.Queue(), list(models), [], {}, []
+    winner = None
+
+    def launch():
+        contender = _Contender(pending.pop(0), open_stream, events)
+        running.append(contender); buffered[contender] = []
+        log(f"Racing model: {contender.model}"); contender.start()
+
+    try:
+        launch(); next_launch = time.monotonic() + hedge_delay
+        while winner is None:
+            while pending and time.monotonic() >= next_launch:
+                launch(); next_launch = time.monotonic() + hedge_delay
+            if all(contender.finished for contender in running):
+                if not pending: return False, skipped, False
+                launch(); next_launch = time.monotonic() + hedge_delay; continue
+            try: contender, kind, payload = events.get(timeout=max(0.0, next_launch - time.monotonic()) if pending else None)
+            except queue.Empty: continue
+            if kind == "chunk":
+                buffered[contender].append(payload)
+                if has_content(payload): winner = contender
+            elif isinstance(payload, Overloaded):
+                contender.finished = True; skipped.append(contender.model); health.release_probe(contender.model)
+                log(f"Model {contender.model} is at its concurrency cap; skipping it.")
+            else:
+                error = payload or RuntimeError("stream ended without any content")
+                contender.finished = True; health.record_failure(contender.model, contender.ttft, error)
+                log(f"Model {contender.model} failed: {str(error)[:150]}...")
+
+        for contender in running:
+            if contender is not winner: contender.cancelled.set()
+        log(f"Race won by model: {winner.model} (ttft {winner.ttft:.2f}s)")
+        yield from buffered.pop(winner)
+        while True:
+            contender, kind, payload = events.get()
+            if contender is not winner: continue
+            if kind == "chunk": yield payload
+            elif kind == "done":
+                winner.finished = True; health.record_success(winner.model, winner.ttft); log(f"Success with model: {winner.model}!")
+                return True, skipped + pending, True
+            else:
+                winner.finished = True; health.record_failure(winner.model, winner.ttft, payload); log(f"Model {winner.model} failed: {str(payload)[:150]}...")
+                return False, skipped + pending, True
+    finally:
+        for contender in running:
+            contender.cancelled.set()
+            if not contender.finished: health.release_probe(contender.model)
+
+async def race_streams_async(models, open_stream, health, log, hedge_delay=0.0, result=None):
+    # asyncio twin of race_streams for the ASGI engine. Async generators cannot return a value,
+    # so (succeeded, untried, committed) is written into `result` instead.
+    events, pending, tasks, buffered, ttfts, skipped = asyncio.Queue(), list(models), {}, {}, {}, []
+    finished, winner = set(), None
+    result = {} if result is None else result
+    result.update(succeeded=False, untried=[], committed=False)
+
+    async def contend(model):
+        started, stream = time.monotonic(), None
+        try:
+            stream = await open_stream(model)
+            async for chunk in stream:
+                if model not in ttfts and has_content(chunk): ttfts[model] = time.monotonic() - started
+                events.put_nowait((model, "chunk", chunk))
+            events.put_nowait((model, "done", None))
+        except Exception as e:
+            events.put_nowait((model, "error", e))
+        finally:
+            if hasattr(stream, "aclose"): await stream.aclose()
+
+    def launch():
+        model = pending.pop(0); buffered[model] = []
+        log(f"Racing model: {model}"); tasks[model] = asyncio.create_task(contend(model))
+
+    try:
+        launch(); next_launch = time.monotonic() + hedge_delay
+        while winner is None:
+            while pending and time.monotonic() >= next_launch:
+                launch(); next_launch = time.monotonic() + hedge_delay
+            if finished == set(tasks):
+                if not pending:
+                    result["untried"] = skipped; return
+                launch(); next_launch = time.monotonic() + hedge_delay; continue
+            try: model, kind, payload = await asyncio.wait_for(events.get(), max(0.0, next_launch - time.monotonic()) if pending else None)
+            except asyncio.TimeoutError: continue
+            if kind == "chunk":
+                buffered[model].append(payload)
+                if has_content(payload): winner = model
+            elif isinstance(payload, Overloaded):
+                finished.add(model); skipped.append(model); health.release_probe(model)
+                log(f"Model {model} is at its concurrency cap; skipping it.")
+            else:
+                error = payload or RuntimeError("stream ended without any content")
+                finished.add(model); health.record_failure(model, ttfts.get(model), error)
+                log(f"Model {model} failed: {str(error)[:150]}...")
+
+        # Losers are cancelled outright; unlike threads, a task can be interrupted mid-await.
+        for model, task in tasks.items():
+            if model != winner: task.cancel()
+        log(f"Race won by model: {winner} (ttft {ttfts[winner]:.2f}s)")
+        result.update(untried=skipped + pending, committed=True)
+        for chunk in buffered.pop(winner): yield chunk
+        while True:
+            model, kind, payload = await events.get()
+            if model != winner: continue
+            if kind == "chunk": yield payload
+            elif kind == "done":
+                finished.add(winner); health.record_success(winner, ttfts[winner]); log(f"Success with model: {winner}!")
+                result["succeeded"] = True; return
+            else:
+                finished.add(winner); health.record_failure(winner, ttfts[winner], payload); log(f"Model {winner} failed: {str(payload)[:150]}..."); return
+    finally:
+        for model, task in tasks.items():
+            task.cancel()
+            if model not in finished: health.release_probe(model)
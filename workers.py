@@ -0,0 +1,111 @@
+# workers.py - Moreweb AI Runtime v0.1.0
+# Multi-process mode: a supervisor runs N headless.py workers on one port, replaces crashed ones and rolls restarts on SIGHUP.
+
+import logging
+import os
+import select
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+READY_TIMEOUT = 60        # seconds a new worker gets to start serving
+RESPAWN_DELAY = 1.0       # pause before replacing a worker that exited on its own
+KILL_MARGIN = 10          # seconds past the drain timeout before a worker that will not stop is killed
+POLL_INTERVAL = 0.2
+
+logger = logging.getLogger("moreweb")
+
+def listening_socket(host, port, reuse_port=False):
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port: sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port)); sock.listen(socket.SOMAXCONN)
+    return sock
+
+class Supervisor:
+    # `command` starts one worker; the supervisor appends --ready-fd and, unless the workers bind their own
+    # SO_REUSEPORT sockets, --worker-fd for the listening socket it shares with all of them. Since the kernel hands
+    # each connection on a shared socket to whichever worker accepts first, a worker that stops accepting to drain
+    # loses no connections, and its replacement is serving before it is asked to stop.
+    def __init__(self, command, count, sock=None, drain_timeout=5):
+        self.command, self.count, self.sock = command, count, sock
+        self.drain_timeout = drain_timeout
+        self.workers = {}
+        self._stopping = self._restarting = False
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._request_stop); signal.signal(signal.SIGINT, self._request_stop)
+        signal.signal(signal.SIGHUP, self._request_restart)
+        try:
+            for _ in range(self.count):
+                if self.start_worker() is None: raise RuntimeError("A worker failed to start.")
+            logger.info(f"Supervisor {os.getpid()} is running {self.count} workers; send SIGHUP for a rolling restart.")
+            while not self._stopping:
+                if self._restarting:
+                    self._restarting = False; self.roll()
+                self.reap()
+                if len(self.workers) < self.count and not self._stopping:
+                    time.sleep(RESPAWN_DELAY); self.start_worker()
+                time.sleep(POLL_INTERVAL)
+        finally:
+            self.stop_all()
+
+    def _request_stop(self, signum, frame): self._stopping = True
+    def _request_restart(self, signum, frame): self._restarting = True
+
+    def start_worker(self):
+        # Returns the new worker once it reports that it is serving, or None if it died or hung during startup.
+        read_fd, write_fd = os.pipe()
+        command, fds = self.command + ["--ready-fd", str(write_fd)], [write_fd]
+        if self.sock is not None:
+            command += ["--worker-fd", str(self.sock.fileno())]; fds.append(self.sock.fileno())
+        try: process = subprocess.Popen(command, pass_fds=fds)
+        finally: os.close(write_fd)
+        try:
+            readable, _, _ = select.select([read_fd], [], [], READY_TIMEOUT)
+            ready = bool(readable) and os.read(read_fd, 1) == b"1"
+        finally: os.close(read_fd)
+        if not ready:
+            logger.warning(f"Worker {process.pid} did not start.")
+            process.kill(); process.wait()
+            return None
+        self.workers[process.pid] = process
+        return process
+
+    def reap(self):
+        for pid, process in list(self.workers.items()):
+            if process.poll() is not None:
+                del self.workers[pid]
+                logger.warning(f"Worker {pid} exited with code {process.returncode}; starting a replacement.")
+
+    def roll(self):
+        # Replaces the workers one at a time, so at least `count` of them are serving throughout.
+        logger.info("Rolling restart of all workers.")
+        for pid, process in list(self.workers.items()):
+            if self._stopping: return
+            if self.start_worker() is None:
+                logger.warning("Rolling restart aborted; the remaining workers keep running."); return
+            del self.workers[pid]; self.stop(process)
+        logger.info("Rolling restart finished.")
+
+    def stop(self, *processes):
+        # SIGTERM makes a worker stop accepting and drain its open requests; stragglers are killed.
+        for process in processes:
+            if process.poll() is None: process.terminate()
+        deadline = time.monotonic() + self.drain_timeout + KILL_MARGIN
+        for process in processes:
+            try: process.wait(max(deadline - time.monotonic(), 0))
+            except subprocess.TimeoutExpired:
+                logger.warning(f"Worker {process.pid} did not stop in time; killing it.")
+                process.kill(); process.wait()
+
+    def stop_all(self):
+        workers, self.workers = list(self.workers.values()), {}
+        self.stop(*workers)
+        if self.sock is not None: self.sock.close()
+
+def worker_command(argv):
+    # The worker command line: this interpreter running headless.py with the supervisor's own options.
+    return [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "headless.py")] + list(argv)